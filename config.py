@@ -10,4 +10,59 @@ NEO4J_CONFIG = {
     'uri': 'bolt://localhost:7687',
     'user': 'neo4j',
     'password': '12345678',
-}
\ No newline at end of file
+}
+
+# 知识抽取配置
+EXTRACT_CONFIG = {
+    'max_workers': 4,  # 同时在途的模型请求数，1 表示逐块顺序抽取
+    'requests_per_second': 2,  # 每秒最多发出的请求数，None 表示不限速
+    'fsync_every': 20,  # 结果日志每写入多少条记录 fsync 一次
+    'cache_path': 'llm_cache.db',  # 大模型响应缓存文件，也保存上传文件的编码检测结果
+    'cache_max_bytes': 512 * 1024 * 1024,  # 缓存总大小上限
+    'cache_max_age_days': 30,  # 缓存条目最长保留天数
+    'cache_bypass': False,  # 为 True 时不读取缓存，强制重新调用模型
+    'http_timeout': (10, 300),  # 模型请求的连接超时与读取超时（秒）
+    'max_retries': 3,  # 连接错误、超时或 5xx 时的最大重试次数
+    'backoff_base': 1.0,  # 指数退避的基数（秒）
+    'backoff_max': 30.0,  # 单次退避等待上限（秒）
+    'breaker_threshold': 5,  # 连续失败多少次后熔断
+    'breaker_cooldown': 60,  # 熔断后暂停请求的时长（秒）
+    'stream': True,  # 流式读取 -stream 模型接口的响应
+    'chunk_max_chars': 5000,  # 每个文本块的最大字符数
+    'chunk_overlap': 200,  # 相邻文本块重叠的最大字符数（按完整句子计）
+    'model_context_tokens': 32768,  # 模型上下文长度
+    'max_output_tokens': 8192,  # 为模型输出预留的 token 数
+    'dedupe_threshold': 0.85,  # 近似重复文本块的 Jaccard 相似度阈值，None 表示不去重
+    'dedupe_shingle_size': 5,  # 计算相似度时的字符 shingle 长度
+    # 组块时除最后一块外每块至少约为 chunk_max_chars 的一半，打包只在 batch_chunk_chars 超过 chunk_max_chars 的一半时生效，
+    # 例如把 chunk_max_chars 调小到 1200 以提高抽取召回，再用打包摊薄提示词开销
+    'batch_chunk_chars': 0,  # 短于该长度的文本块打包为一次请求，0 表示不打包
+    'batch_max_chunks': 4,  # 每次请求最多打包的文本块数
+    'batch_max_chars': 5000,  # 每次打包请求的输入总字符数上限
+}
+
+# 知识库存储配置
+STORAGE_CONFIG = {
+    'backend': 'mysql',  # mysql：连接 DB_CONFIG 中的 MySQL；sqlite：使用本地 SQLite 文件，无需数据库服务
+    'sqlite_path': 'data_graph.db',  # SQLite 数据库文件，相对路径以项目根目录为基准
+    'sqlite_cache_mb': 64,  # SQLite 页缓存大小（MB）
+}
+
+# 知识融合配置
+MERGE_CONFIG = {
+    'batch_size': 5000,  # 合并重复实体时每个事务处理的重复实体数
+    'normalize_names': True,  # 同名合并后，再按规范化名称（全半角、大小写、标点、后缀）合并同类型实体
+    'traditional_to_simplified': False,  # 规范化时把繁体转为简体，需要安装 opencc
+    'name_suffixes': {  # 实体类型 -> 规范化时去掉的名称后缀，'*' 对所有类型生效
+        '人物': ['先生', '女士', '小姐', '同志', '老师', '大师', '教授', '博士', '将军'],
+        '组织与联盟': ['有限责任公司', '有限公司', '集团'],
+    },
+}
+
+# 知识入库配置
+INGEST_CONFIG = {
+    'mode': 'bulk',  # bulk：批量 executemany 入库；row：逐行插入并逐条提交
+    'batch_size': 1000,  # 批量入库时每个事务写入的行数
+    'resolve_identity': True,  # 仅 bulk 模式：按 (类型, 名称) 生成稳定实体 ID，入库时即合并重复实体
+    'attribute_storage': 'eav',  # eav：属性逐条写入 EntityAttributes；json：整体写入 Entities.attributes JSON 列
+}
@@ -0,0 +1,125 @@
+import codecs
+import re
+
+# 句末标点（含中文标点），其后紧跟的引号、括号归入同一句
+SENTENCE_PATTERN = re.compile(r'[^。！？；!?;…\n]*(?:[。！？；!?;…]+[”’」』）)"\']*|\n+|$)')
+
+
+def estimate_tokens(text):
+    """
+    粗略估计 token 数：中日韩字符按每字 1 个 token，其余字符按每 4 个字符 1 个 token。
+    """
+    cjk = sum(1 for char in text if '\u3000' <= char <= '\u9fff' or '\uff00' <= char <= '\uffef')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def context_chunk_budget(context_tokens, prompt_text, max_output_tokens):
+    """
+    根据模型上下文长度计算每个文本块可用的 token 数：上下文减去提示词与预留的输出长度。
+    """
+    budget = context_tokens - estimate_tokens(prompt_text) - max_output_tokens
+    if budget <= 0:
+        raise ValueError(f"Prompt and output reserve exceed the model context of {context_tokens} tokens.")
+    return budget
+
+
+def iter_file_text(file_path, encoding, block_size=64 * 1024):
+    """
+    按块读取并增量解码文件，多字节字符跨块时由增量解码器拼接。
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            text = decoder.decode(block)
+            if text:
+                yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_sentences(text_iter):
+    """
+    将流式文本切分为句子，返回 (句子, 是否为段落结尾)。未以句末标点结束的残句留到下一块文本继续拼接。
+    """
+    pending = ''
+    for text in text_iter:
+        pending += text
+        sentences = [s for s in SENTENCE_PATTERN.findall(pending) if s]
+        # 最后一句可能还没读完，保留到下一轮
+        pending = sentences.pop() if sentences else ''
+        for sentence in sentences:
+            yield sentence, sentence.endswith('\n')
+    if pending:
+        yield pending, True
+
+
+def split_long_sentence(sentence, max_chars):
+    # 超长的句子只能按字数硬切
+    return [sentence[i:i + max_chars] for i in range(0, len(sentence), max_chars)]
+
+
+def iter_chunks(text_iter, max_chars=5000, max_tokens=None, overlap=0):
+    """
+    按段落和句子边界组块：每块不超过 max_chars 个字符和 max_tokens 个 token，
+    优先在块后半部分的段落结尾处断开；相邻块之间重叠末尾不超过 overlap 个字符的完整句子。
+    """
+    units = []  # [(句子, 是否为段落结尾)]
+    size = 0
+    tokens = 0
+
+    def fits(sentence):
+        if size + len(sentence) > max_chars:
+            return False
+        return max_tokens is None or tokens + estimate_tokens(sentence) <= max_tokens
+
+    def cut_point():
+        # 块后半部分若有段落结尾，则在最后一个段落结尾处断开
+        length = 0
+        cut = len(units)
+        for i, (sentence, paragraph_end) in enumerate(units):
+            length += len(sentence)
+            if paragraph_end and length >= size / 2:
+                cut = i + 1
+        return cut
+
+    def overlap_units(emitted):
+        carried = []
+        length = 0
+        for sentence, paragraph_end in reversed(emitted):
+            if length + len(sentence) > overlap:
+                break
+            carried.insert(0, (sentence, paragraph_end))
+            length += len(sentence)
+        return carried
+
+    # token 上限按每字 1 个 token 的最坏情况折算成硬切长度
+    piece_limit = min(max_chars, max_tokens) if max_tokens else max_chars
+
+    for sentence, paragraph_end in iter_sentences(text_iter):
+        pieces = split_long_sentence(sentence, piece_limit) if len(sentence) > piece_limit else [sentence]
+        for piece in pieces:
+            while units and not fits(piece):
+                cut = cut_point()
+                emitted, rest = units[:cut], units[cut:]
+                chunk = ''.join(s for s, _ in emitted)
+                if chunk.strip():
+                    yield chunk
+
+                carried = overlap_units(emitted) if overlap else []
+                units = carried + rest
+                size = sum(len(s) for s, _ in units)
+                tokens = sum(estimate_tokens(s) for s, _ in units)
+                if carried and not fits(piece):
+                    # 带上重叠句子后仍放不下新句子时放弃重叠，避免重复输出同样的内容
+                    units = rest
+                    size = sum(len(s) for s, _ in units)
+                    tokens = sum(estimate_tokens(s) for s, _ in units)
+
+            units.append((piece, paragraph_end and piece is pieces[-1]))
+            size += len(piece)
+            tokens += estimate_tokens(piece)
+
+    chunk = ''.join(s for s, _ in units)
+    if chunk.strip():
+        yield chunk
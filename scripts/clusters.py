@@ -0,0 +1,63 @@
+import json
+from collections import defaultdict
+
+
+class DisjointSet:
+    """
+    并查集：把高相似度实体对合并为连通分量，A~B、B~C 得到同一个聚类 {A, B, C}。
+    查找时做路径压缩，合并时小集合挂到大集合下。
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+            return item
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return first
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+        return first
+
+    def components(self):
+        groups = defaultdict(list)
+        for item in self.parent:
+            groups[self.find(item)].append(item)
+        return list(groups.values())
+
+
+def build_clusters(disjoint_set):
+    """
+    返回 [{"canonical": 保留实体, "members": [聚类内全部实体]}]，与 data_merge 一致，以 entity_id 最小的实体为保留实体。
+    """
+    clusters = []
+    for members in disjoint_set.components():
+        if len(members) > 1:
+            members = sorted(members)
+            clusters.append({"canonical": members[0], "members": members})
+    return sorted(clusters, key=lambda cluster: cluster["canonical"])
+
+
+def save_clusters(path, clusters_by_type):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(clusters_by_type, f, ensure_ascii=False, indent=4)
+
+
+def load_clusters(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
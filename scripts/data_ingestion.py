@@ -1,160 +1,506 @@
-import pymysql
-from pymysql import MySQLError as Error
 import logging
 import uuid
 import json
 import os
+import time
+import itertools
+import unicodedata
 
 # 数据库配置
-from config import DB_CONFIG
+from config import INGEST_CONFIG
+from result_log import iter_records
+from schema import create_tables, relationship_upsert_sql
+from storage import DB_ERRORS as Error, connect_storage
 
 # 日志配置
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def create_tables(cursor):
-    # 创建表结构
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Entities (
-        entity_id VARCHAR(255) PRIMARY KEY,
-        entity_type VARCHAR(255),
-        entity_name VARCHAR(255)
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS EntityAttributes (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        entity_id VARCHAR(255),
-        attribute_name VARCHAR(255),
-        attribute_value VARCHAR(255),
-        FOREIGN KEY (entity_id) REFERENCES Entities(entity_id),
-        UNIQUE(entity_id, attribute_name)
-    );
-    """)
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS Relationships (
-        id INT AUTO_INCREMENT PRIMARY KEY,
-        source_id VARCHAR(255),
-        relation VARCHAR(255),
-        target_id VARCHAR(255),
-        FOREIGN KEY (source_id) REFERENCES Entities(entity_id),
-        FOREIGN KEY (target_id) REFERENCES Entities(entity_id)
-    );
-    """)
-
-
-def read_file(file_path):
-    # 尝试使用 utf-8 编码读取文件，若失败则报告错误
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except UnicodeDecodeError as e:
-        logging.error(f"Error reading file {file_path} with utf-8 encoding: {e}")
-        raise
+class ErrorDataWriter:
+    """
+    逐条写入解析失败的数据，出现第一条错误时才创建错误文件。
+    """
+
+    def __init__(self, error_file_path):
+        self.error_file_path = error_file_path
+        self.file = None
+        self.count = 0
+
+    def write(self, item):
+        if self.file is None:
+            self.file = open(self.error_file_path, 'w', encoding='utf-8')
+        self.file.write(item + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        if self.file is None:
+            logging.info("No errors found in JSON data.")
+            return
+        self.file.close()
+        logging.info(f"{self.count} error records saved to {self.error_file_path}")
+
+
+def iter_json_array(file_path, read_size=64 * 1024):
+    """
+    增量解析顶层 JSON 数组，每次只在内存中保留当前元素所需的文本，逐个返回数组元素。
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        started = False
+        size = read_size
+
+        while True:
+            # 跳过空白，缓冲区用尽时继续读取
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+
+            if pos >= len(buffer):
+                raise ValueError("Unexpected end of file while parsing the top-level JSON array.")
+
+            char = buffer[pos]
+            if not started:
+                if char != '[':
+                    raise ValueError("Top-level JSON element must be a list of blocks.")
+                started = True
+                pos += 1
+                continue
+            if char == ']':
+                return
+            if char == ',':
+                pos += 1
+                continue
 
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError("Element may continue in the next read", buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # 当前元素还没读完：按倍数扩大读取量，避免超大元素被反复重新解析
+                chunk = f.read(size)
+                size *= 2
+                eof = not chunk
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
 
-def load_and_parse_data(file_path):
-    error_data = []
-    valid_data = []
+            size = read_size
+            yield element
+            buffer, pos = buffer[end:], 0
 
-    try:
-        # 读取文件内容
-        raw_content = read_file(file_path)
-        # 使用标准 JSON 解析文件内容
-        data_blocks = json.loads(raw_content)
 
-        # 确保数据为列表格式
-        if not isinstance(data_blocks, list):
-            raise ValueError("Top-level JSON element must be a list of blocks.")
-
-        for block_index, block in enumerate(data_blocks):
+def iter_data_blocks(file_path, error_writer):
+    """
+    流式读取旧版 JSON 数组格式的抽取结果，逐个返回合法的 (块序号, block)，不合法的写入错误文件。
+    """
+    block_index = 0
+    try:
+        for block_index, block in enumerate(iter_json_array(file_path)):
             # 检查每个 block 是否为列表
             if not isinstance(block, list):
                 logging.error(f"Block {block_index} is not a list. Skipping...")
-                error_data.append(f"Block {block_index}: {json.dumps(block)} (Not a list)")
+                error_writer.write(f"Block {block_index}: {json.dumps(block)} (Not a list)")
                 continue
-            valid_data.append(block)
+            yield block_index, block
     except (ValueError, json.JSONDecodeError) as e:
-        logging.error(f"Failed to parse JSON file: {e}")
-        error_data.append(f"Error parsing JSON file: {e}")
-
-    return valid_data, error_data
-
-
-def save_error_data(error_data, error_file_path):
-    # 保存解析失败的错误数据
-    if not error_data:
-        logging.info("No errors found in JSON data.")
-        return
-
-    with open(error_file_path, 'w', encoding='utf-8') as f:
-        for item in error_data:
-            f.write(item + "\n")
-    logging.info(f"Error data saved to {error_file_path}")
-
-
-def insert_data(cursor, conn, data_blocks):
+        # 语法错误之后的内容无法定位下一个 block，已返回的 block 仍会入库
+        logging.error(f"Failed to parse JSON file after block {block_index}: {e}")
+        error_writer.write(f"Error parsing JSON file after block {block_index}: {e}")
+
+
+def iter_log_blocks(file_path, error_writer):
+    """
+    直接读取抽取脚本生成的结果日志，每行一条 {"index": 块序号, "result": 抽取结果} 记录，返回 (块序号, block)。
+    """
+    for record in iter_records(file_path):
+        if 'error' in record:
+            # 无法解析的块已由抽取脚本写入死信文件
+            logging.warning(f"Block {record.get('index')} was dead-lettered during extraction. Skipping...")
+            continue
+        block = record.get('result')
+        if not isinstance(block, list):
+            logging.error(f"Block {record.get('index')} is not a list. Skipping...")
+            error_writer.write(f"Block {record.get('index')}: {json.dumps(block, ensure_ascii=False)} (Not a list)")
+            continue
+        yield record['index'], block
+
+
+def insert_data(cursor, conn, data_blocks, attribute_storage='eav'):
+    """
+    逐行入库：每个条目一个事务，返回成功写入的行数。与批量入库一样记录耗时和每秒行数，便于比较两种模式。
+    """
+    statements = ingest_statements(conn, attribute_storage=attribute_storage)
     id_mapping = {}  # 创建原始entity_id到UUID的映射
-    for block in data_blocks:
+    written = 0
+    start = time.perf_counter()
+    for chunk_index, block in data_blocks:
         for item in block:
             try:
-                insert_entities(cursor, item, id_mapping)
-                insert_relationships(cursor, item, id_mapping)
+                rows = insert_entities(cursor, item, id_mapping, statements, attribute_storage)
+                rows += insert_relationships(cursor, item, id_mapping, statements, chunk_index)
                 conn.commit()  # 使用数据库连接对象进行提交
+                written += rows
             except Exception as e:
                 logging.error(f"Error processing item: {item}. Error: {e}")
                 conn.rollback()  # 使用数据库连接对象进行回滚
 
+    elapsed = time.perf_counter() - start
+    logging.info(f"Row ingestion finished: {written} rows in {elapsed:.2f}s "
+                 f"({written / elapsed if elapsed else 0:.0f} rows/s)")
+    return written
+
+
+def normalize_attribute_value(attr_value):
+    if attr_value is None:
+        return 'NULL'
+    if isinstance(attr_value, list):
+        return ','.join(map(str, attr_value))
+    return attr_value
+
 
-def insert_entities(cursor, item, id_mapping):
+def insert_entities(cursor, item, id_mapping, statements, attribute_storage='eav'):
     entities = item.get("entities", [])
+    rows = 0
     for entity in entities:
         original_entity_id = entity['id']
-        entity_id = str(uuid.uuid4())  # 生成UUID作为新的entity_id
+        entity_uuid = str(uuid.uuid4())  # 生成UUID作为实体的外部标识
         entity_type = entity['type']
         entity_name = entity['name']
+        attributes = entity.get('attributes', {})
+
+        logging.info(f"Inserting entity: {entity_uuid}, {entity_type}, {entity_name}")
+        if attribute_storage == 'json':
+            # 属性整体写入 JSON 列，不再逐条写入 EntityAttributes
+            cursor.execute("""
+            INSERT INTO Entities (entity_uuid, entity_type, entity_name, attributes) 
+            VALUES (%s, %s, %s, %s)
+            """, (entity_uuid, entity_type, entity_name, attributes_json(attributes)))
+            id_mapping[original_entity_id] = cursor.lastrowid
+            rows += 1
+            continue
 
-        logging.info(f"Inserting entity: {entity_id}, {entity_type}, {entity_name}")
         cursor.execute("""
-        INSERT INTO Entities (entity_id, entity_type, entity_name) 
+        INSERT INTO Entities (entity_uuid, entity_type, entity_name) 
         VALUES (%s, %s, %s)
-        ON DUPLICATE KEY UPDATE entity_type = VALUES(entity_type), entity_name = VALUES(entity_name);
-        """, (entity_id, entity_type, entity_name))
+        """, (entity_uuid, entity_type, entity_name))
+        entity_id = cursor.lastrowid  # 整数主键
 
-        # 保存原始entity_id到UUID的映射
+        # 保存原始entity_id到实体主键的映射
         id_mapping[original_entity_id] = entity_id
+        rows += 1
 
-        attributes = entity.get('attributes', {})
         for attr_name, attr_value in attributes.items():
-            if attr_value is None:
-                attr_value = 'NULL'
-            elif isinstance(attr_value, list):
-                attr_value = ','.join(map(str, attr_value))
+            attr_value = normalize_attribute_value(attr_value)
             logging.info(f"Inserting attribute for {entity_id}: {attr_name} = {attr_value}")
-            cursor.execute("""
-            INSERT INTO EntityAttributes (entity_id, attribute_name, attribute_value) 
-            VALUES (%s, %s, %s)
-            ON DUPLICATE KEY UPDATE attribute_value = VALUES(attribute_value);
-            """, (entity_id, attr_name, attr_value))
+            cursor.execute(statements['attribute'], (entity_id, attr_name, attr_value))
+            rows += 1
+    return rows
 
 
-def insert_relationships(cursor, item, id_mapping):
+def attributes_json(attributes):
+    return json.dumps({name: normalize_attribute_value(value) for name, value in attributes.items()},
+                      ensure_ascii=False)
+
+
+def insert_relationships(cursor, item, id_mapping, statements, chunk_index=None):
     relationships = item.get("relationships", [])
+    source_chunks = json.dumps([] if chunk_index is None else [chunk_index])
+    rows = 0
     for relationship in relationships:
         source_id = id_mapping.get(relationship['source'])
         target_id = id_mapping.get(relationship['target'])
-        relation = relationship['relation']
+        relation = relationship['relation'] or ''
 
         if source_id and target_id:
             logging.info(f"Inserting relationship: {source_id} - {relation} -> {target_id}")
-            cursor.execute("""
-            INSERT INTO Relationships (source_id, relation, target_id) 
-            VALUES (%s, %s, %s);
-            """, (source_id, relation, target_id))
+            cursor.execute(statements['relationship'], (source_id, relation, target_id, 1, source_chunks))
+            rows += 1
         else:
             logging.error(f"Relationship source or target not found: {relationship}")
+    return rows
+
+
+def ingest_statements(storage, resolve_identity=False, attribute_storage='eav'):
+    """
+    按存储后端生成入库语句，返回 {'entity': ..., 'attribute': ..., 'relationship': ...}。
+    """
+    entity_columns = ('entity_uuid', 'entity_type', 'entity_name')
+    entity_updates = {'entity_type': 'excluded.entity_type', 'entity_name': 'excluded.entity_name'}
+    if attribute_storage == 'json':
+        # JSON 属性存储：属性随实体一起写入，已存在的实体把新属性合并进原有的 JSON 文档
+        entity_columns += ('attributes',)
+        entity_updates['attributes'] = storage.json_merge_patch("COALESCE(attributes, '{}')",
+                                                                'excluded.attributes')
+
+    if resolve_identity:
+        # 实体身份确定后，同一属性以先入库的有效值为准，只有原值为 'NULL' 时才覆盖
+        attribute_value = ("CASE WHEN attribute_value = 'NULL' THEN excluded.attribute_value "
+                           "ELSE attribute_value END")
+    else:
+        attribute_value = 'excluded.attribute_value'
+
+    return {
+        'entity': storage.upsert('Entities', entity_columns, ('entity_uuid',), entity_updates),
+        'attribute': storage.upsert('EntityAttributes', ('entity_id', 'attribute_name', 'attribute_value'),
+                                    ('entity_id', 'attribute_name'), {'attribute_value': attribute_value}),
+        'relationship': relationship_upsert_sql(storage),
+    }
+
+
+# 稳定实体 ID 的命名空间，修改后已入库实体的 ID 将无法对应
+ENTITY_NAMESPACE = uuid.UUID('6f1c1d5e-3b0a-5c47-9a8e-2d4f7b1e0c93')
+
+
+class EntityResolver:
+    """
+    入库时确定实体身份：按规范化后的 (类型, 名称) 生成稳定的 UUID，
+    同一实体在不同文本块、不同批次甚至不同次上传中都落到同一行，属性在写入时合并。
+    """
+
+    def __init__(self):
+        self.entity_ids = set()  # 本次入库已写出的实体
+        self.attributes = {}  # (实体 ID, 属性名) -> 已写出的属性值
+
+    @staticmethod
+    def normalize(text):
+        return ' '.join(unicodedata.normalize('NFKC', str(text)).split())
+
+    def resolve(self, entity_type, entity_name):
+        key = f"{self.normalize(entity_type)}\x1f{self.normalize(entity_name)}"
+        return str(uuid.uuid5(ENTITY_NAMESPACE, key))
+
+    def is_new_entity(self, entity_id):
+        if entity_id in self.entity_ids:
+            return False
+        self.entity_ids.add(entity_id)
+        return True
+
+    def merge_attribute(self, entity_id, attr_name, attr_value):
+        """
+        返回该属性是否需要写出：首次出现，或已写出的值为 'NULL' 而新值有效。
+        """
+        previous = self.attributes.get((entity_id, attr_name))
+        if previous is not None and (previous != 'NULL' or attr_value == 'NULL'):
+            return False
+        self.attributes[(entity_id, attr_name)] = attr_value
+        return True
+
+    def forget(self, entity_rows, attribute_rows):
+        """
+        条目回滚后撤销它写出的实体和属性，之后再出现时重新写出。
+        """
+        for row in entity_rows:
+            self.entity_ids.discard(row[0])
+            if len(row) > 3:
+                # JSON 属性存储时属性随实体行写出
+                for attr_name in json.loads(row[3]):
+                    self.attributes.pop((row[0], attr_name), None)
+        for entity_id, attr_name, _ in attribute_rows:
+            self.attributes.pop((entity_id, attr_name), None)
+
+
+def build_item_rows(item, id_mapping, resolver=None, chunk_index=None, attribute_storage='eav'):
+    """
+    将一个抽取条目转换为待插入的实体、属性和关系行，不访问数据库。
+    指定 resolver 时实体 ID 由 (类型, 名称) 决定，重复出现的实体和属性不再重复写出。
+    关系行附带来源块序号 chunk_index。attribute_storage='json' 时属性并入实体行，属性行为空。
+    条目的所有字段先读取校验，格式有误时在修改 resolver 和 id_mapping 之前抛出异常。
+    """
+    entities = [(entity['id'], entity['type'], entity['name'],
+                 {attr_name: normalize_attribute_value(attr_value)
+                  for attr_name, attr_value in (entity.get('attributes') or {}).items()})
+                for entity in item.get("entities", [])]
+    relationships = [(relationship['source'], relationship['relation'] or '', relationship['target'], relationship)
+                     for relationship in item.get("relationships", [])]
+
+    entity_rows = []
+    attribute_rows = []
+    relationship_rows = []
+
+    for original_id, entity_type, entity_name, entity_attributes in entities:
+        if resolver is None:
+            entity_id = str(uuid.uuid4())
+            is_new = True
+        else:
+            entity_id = resolver.resolve(entity_type, entity_name)
+            is_new = resolver.is_new_entity(entity_id)
+        id_mapping[original_id] = entity_id
+
+        attributes = {}
+        for attr_name, attr_value in entity_attributes.items():
+            if resolver is None or resolver.merge_attribute(entity_id, attr_name, attr_value):
+                attributes[attr_name] = attr_value
+
+        if attribute_storage == 'json':
+            # 已写出的实体有新属性时同样写出一行，由实体语句合并属性
+            if is_new or attributes:
+                entity_rows.append((entity_id, entity_type, entity_name, json.dumps(attributes, ensure_ascii=False)))
+            continue
+        if is_new:
+            entity_rows.append((entity_id, entity_type, entity_name))
+        attribute_rows.extend((entity_id, attr_name, attr_value) for attr_name, attr_value in attributes.items())
+
+    for source, relation, target, relationship in relationships:
+        source_id = id_mapping.get(source)
+        target_id = id_mapping.get(target)
+        if source_id and target_id:
+            relationship_rows.append((source_id, relation, target_id, chunk_index))
+        else:
+            logging.error(f"Relationship source or target not found: {relationship}")
+
+    return entity_rows, attribute_rows, relationship_rows
+
+
+def lookup_entity_ids(cursor, entity_uuids, known_ids, chunk_size=500):
+    """
+    查询实体 UUID 对应的整数主键，结果写入 known_ids。
+    """
+    entity_uuids = list(entity_uuids)
+    for start in range(0, len(entity_uuids), chunk_size):
+        part = entity_uuids[start:start + chunk_size]
+        placeholders = ', '.join(['%s'] * len(part))
+        cursor.execute(f"SELECT entity_id, entity_uuid FROM Entities WHERE entity_uuid IN ({placeholders})", part)
+        for row in cursor.fetchall():
+            known_ids[row['entity_uuid']] = row['entity_id']
+
+
+def write_rows(cursor, item_rows, known_ids, statements):
+    # 实体必须先于属性和关系写入，以满足外键约束
+    cursor.executemany(statements['entity'], [row for rows in item_rows for row in rows[0]])
+
+    # 属性和关系中引用的是实体 UUID，写入前换成整数主键
+    attribute_rows = [row for rows in item_rows for row in rows[1]]
+    relationship_rows = [row for rows in item_rows for row in rows[2]]
+    referenced = {row[0] for row in attribute_rows}
+    referenced.update(entity_uuid for row in relationship_rows for entity_uuid in (row[0], row[2]))
+    lookup_entity_ids(cursor, referenced - known_ids.keys(), known_ids)
+
+    cursor.executemany(statements['attribute'], [(known_ids[entity_uuid], attr_name, attr_value)
+                                                 for entity_uuid, attr_name, attr_value in attribute_rows])
+    cursor.executemany(statements['relationship'], aggregate_relationships(relationship_rows, known_ids))
+
+
+def aggregate_relationships(relationship_rows, known_ids):
+    """
+    批内先按 (源, 关系, 目标) 合并，返回 (源主键, 关系, 目标主键, 出现次数, 来源块 JSON) 行。
+    """
+    merged = {}
+    for source, relation, target, chunk_index in relationship_rows:
+        key = (known_ids[source], relation, known_ids[target])
+        count, chunks = merged.get(key, (0, set()))
+        if chunk_index is not None:
+            chunks.add(chunk_index)
+        merged[key] = (count + 1, chunks)
+    return [key + (count, json.dumps(sorted(chunks))) for key, (count, chunks) in merged.items()]
+
+
+def flush_batch(cursor, conn, item_rows, known_ids, statements, resolver=None):
+    """
+    以一个事务写入一批条目，返回成功写入的行数。
+    整批失败时回滚并逐条目重试，只丢弃出错的条目。
+    丢弃的条目首次写出的实体会从 resolver 中撤销；同一批后续条目引用这些实体时把实体行补写在该条目中。
+    """
+    try:
+        write_rows(cursor, item_rows, known_ids, statements)
+        conn.commit()
+        return sum(len(rows) for item in item_rows for rows in item)
+    except Error + (KeyError,) as e:
+        conn.rollback()
+        forget_entity_ids(item_rows, known_ids)
+        logging.error(f"Batch insert failed, retrying {len(item_rows)} items one by one. Error: {e}")
+
+    written = 0
+    dropped = {}  # 丢弃的条目中首次写出的实体行，实体 UUID -> 实体行
+    for rows in item_rows:
+        if dropped:
+            rows = with_dropped_entities(rows, dropped)
+        try:
+            write_rows(cursor, [rows], known_ids, statements)
+            conn.commit()
+            written += sum(len(part) for part in rows)
+        except Error + (KeyError,) as e:
+            conn.rollback()
+            forget_entity_ids([rows], known_ids)
+            if resolver is not None:
+                resolver.forget(rows[0], rows[1])
+            dropped.update((row[0], row) for row in rows[0])
+            logging.error(f"Error inserting item rows: {rows}. Error: {e}")
+    return written
+
+
+def with_dropped_entities(rows, dropped):
+    """
+    条目引用了被丢弃条目首次写出的实体时，把这些实体行补进该条目的实体行中。
+    """
+    entity_rows, attribute_rows, relationship_rows = rows
+    emitted = {row[0] for row in entity_rows}
+    referenced = {row[0] for row in attribute_rows}
+    referenced.update(entity_uuid for row in relationship_rows for entity_uuid in (row[0], row[2]))
+    missing = [dropped.pop(entity_uuid) for entity_uuid in referenced - emitted if entity_uuid in dropped]
+    # 只补写实体本身，JSON 属性存储时不带上被丢弃条目的属性
+    missing = [row[:3] + ('{}',) if len(row) > 3 else row for row in missing]
+    return missing + entity_rows, attribute_rows, relationship_rows
+
+
+def forget_entity_ids(item_rows, known_ids):
+    # 回滚后本批新插入实体的主键已失效
+    for rows in item_rows:
+        for row in rows[0]:
+            known_ids.pop(row[0], None)
+
+
+def insert_data_bulk(cursor, conn, data_blocks, batch_size=1000, resolve_identity=False, attribute_storage='eav'):
+    """
+    批量入库：缓存各条目的行，累计达到 batch_size 行后用多行 executemany 写入，每批一个事务。
+    批次只在 block 边界切分，同一文本块的关系总在同一批内合并。
+    resolve_identity=True 时在入库过程中合并同名同类型的实体，数据落库即已去重。
+    attribute_storage='json' 时属性以 JSON 文档随实体行写入。
+    """
+    resolver = EntityResolver() if resolve_identity else None
+    statements = ingest_statements(conn, resolve_identity, attribute_storage)
+    id_mapping = {}  # 创建原始entity_id到UUID的映射
+    known_ids = {}  # 实体 UUID -> 整数主键
+    item_rows = []
+    buffered = 0
+    written = 0
+    start = time.perf_counter()
+
+    for chunk_index, block in data_blocks:
+        for item in block:
+            try:
+                rows = build_item_rows(item, id_mapping, resolver, chunk_index, attribute_storage)
+            except (KeyError, TypeError, AttributeError) as e:
+                logging.error(f"Error processing item: {item}. Error: {e}")
+                continue
+            item_rows.append(rows)
+            buffered += sum(len(part) for part in rows)
+
+        if buffered >= batch_size:
+            written += flush_batch(cursor, conn, item_rows, known_ids, statements, resolver)
+            item_rows = []
+            buffered = 0
+            elapsed = time.perf_counter() - start
+            logging.info(f"Inserted {written} rows ({written / elapsed:.0f} rows/s)")
+
+    if item_rows:
+        written += flush_batch(cursor, conn, item_rows, known_ids, statements, resolver)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Bulk ingestion finished: {written} rows in {elapsed:.2f}s "
+                 f"({written / elapsed if elapsed else 0:.0f} rows/s)")
+    if resolver is not None:
+        logging.info(f"Resolved entity mentions to {len(resolver.entity_ids)} distinct entities")
+    return written
 
 
 def main():
@@ -163,30 +509,35 @@ def main():
     # 获取项目根目录路径
     root_dir = os.path.dirname(script_dir)
 
-    # 指定 JSON 文件路径
+    # 指定 JSON 文件路径，优先读取抽取脚本生成的结果日志
+    log_file_path = os.path.join(root_dir, 'extracted_info_01.jsonl')
     file_path = os.path.join(root_dir, 'extracted_info_01.json')
     error_file_path = os.path.join(root_dir, 'error_data.json')  # 错误数据保存的路径
 
-    valid_data, error_data = load_and_parse_data(file_path)
+    error_writer = ErrorDataWriter(error_file_path)
+    if os.path.exists(log_file_path):
+        data_blocks = iter_log_blocks(log_file_path, error_writer)
+    else:
+        data_blocks = iter_data_blocks(file_path, error_writer)
 
-    if error_data:
-        save_error_data(error_data, error_file_path)
+    # 先取出第一个合法 block，没有数据时不连接数据库
+    first_block = next(data_blocks, None)
 
-    if valid_data:
+    if first_block is not None:
+        valid_data = itertools.chain([first_block], data_blocks)
         conn = None
         cursor = None
         try:
-            conn = pymysql.connect(
-                host=DB_CONFIG['host'],
-                user=DB_CONFIG['user'],
-                password=DB_CONFIG['password'],
-                database=DB_CONFIG['database'],
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
+            conn = connect_storage()
             cursor = conn.cursor()
-            create_tables(cursor)
-            insert_data(cursor, conn, valid_data)  # 将连接对象传递给 insert_data
+            create_tables(cursor, conn.backend)
+            if INGEST_CONFIG['mode'] == 'bulk':
+                insert_data_bulk(cursor, conn, valid_data, batch_size=INGEST_CONFIG['batch_size'],
+                                 resolve_identity=INGEST_CONFIG['resolve_identity'],
+                                 attribute_storage=INGEST_CONFIG['attribute_storage'])
+            else:
+                # 将连接对象传递给 insert_data
+                insert_data(cursor, conn, valid_data, attribute_storage=INGEST_CONFIG['attribute_storage'])
         except Error as e:
             logging.error(f"Database error: {e}")
         finally:
@@ -197,6 +548,8 @@ def main():
     else:
         logging.warning("No valid data available to insert into the database.")
 
+    error_writer.close()
+
 
 if __name__ == "__main__":
     main()
@@ -1,87 +1,220 @@
-import pymysql
-from pymysql import MySQLError as Error
+import json
 import logging
-from config import DB_CONFIG
+from collections import defaultdict
+from config import MERGE_CONFIG
+from name_blocking import NameNormalizer, build_blocking_index
+from schema import relationship_upsert_sql
+from storage import DB_ERRORS as Error, connect_storage
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# 重复实体 -> 保留实体的映射，一次性建好后按批改写属性和关系
+MERGE_MAP_DDL = """
+CREATE TEMPORARY TABLE EntityMergeMap (
+    duplicate_id INT PRIMARY KEY,
+    canonical_id INT NOT NULL
+)
+"""
+
+# 当前批次的映射。MySQL 的临时表在同一条语句中只能引用一次，因此每条改写语句只联接一次映射表
+MERGE_BATCH_DDL = """
+CREATE TEMPORARY TABLE EntityMergeBatch (
+    duplicate_id INT PRIMARY KEY,
+    canonical_id INT NOT NULL
+)
+"""
+
+
+def create_merge_map(cursor, conn):
+    cursor.execute(conn.drop_temporary('EntityMergeMap'))
+    cursor.execute(MERGE_MAP_DDL)
+
+
+def flatten_merge_map(merge_map):
+    """
+    把 {重复实体: 保留实体} 中的链式映射（a -> b -> c）展开为直接指向最终保留实体，并去掉指向自身的项。
+    """
+    flat = {}
+    for duplicate_id in merge_map:
+        canonical_id = duplicate_id
+        seen = set()
+        while canonical_id in merge_map and canonical_id not in seen:
+            seen.add(canonical_id)
+            canonical_id = merge_map[canonical_id]
+        if canonical_id != duplicate_id:
+            flat[duplicate_id] = canonical_id
+    return flat
+
+
+def load_merge_map(cursor, conn, merge_map):
+    """
+    将 Python 中得到的 {重复实体: 保留实体} 写入 EntityMergeMap。
+    """
+    create_merge_map(cursor, conn)
+    cursor.executemany("INSERT INTO EntityMergeMap (duplicate_id, canonical_id) VALUES (%s, %s)",
+                       sorted(flatten_merge_map(merge_map).items()))
+
+
+def build_name_merge_map(cursor, conn):
+    """
+    同名实体以 entity_id 最小的一个为保留实体，其余写入 EntityMergeMap，返回重复实体数。
+    """
+    create_merge_map(cursor, conn)
+    cursor.execute("""
+    INSERT INTO EntityMergeMap (duplicate_id, canonical_id)
+    SELECT e.entity_id, c.canonical_id
+    FROM Entities e
+    JOIN (
+        SELECT entity_name, MIN(entity_id) AS canonical_id
+        FROM Entities
+        GROUP BY entity_name
+        HAVING COUNT(*) > 1
+    ) c ON e.entity_name = c.entity_name
+    WHERE e.entity_id <> c.canonical_id
+    """)
+    return cursor.rowcount
+
+
+def move_relationships(cursor, conn, column):
+    """
+    把 column（source_id 或 target_id）指向重复实体的关系改为指向保留实体。
+    关系按 (源, 关系, 目标) 唯一，改写后与已有关系冲突的行合并出现次数和来源块。
+    """
+    source = 'm.canonical_id' if column == 'source_id' else 'r.source_id'
+    target = 'm.canonical_id' if column == 'target_id' else 'r.target_id'
+    cursor.execute(conn.drop_temporary('RelationshipMoves'))
+    cursor.execute(f"""
+    CREATE TEMPORARY TABLE RelationshipMoves AS
+    SELECT r.id AS moved_id, {source} AS moved_source, r.relation AS moved_relation, {target} AS moved_target,
+           r.occurrence_count AS moved_count, r.source_chunks AS moved_chunks
+    FROM Relationships r
+    JOIN EntityMergeBatch m ON r.{column} = m.duplicate_id
+    """)
+    cursor.execute("DELETE FROM Relationships WHERE id IN (SELECT moved_id FROM RelationshipMoves)")
+    cursor.execute(relationship_upsert_sql(conn, select="""
+    SELECT moved_source, moved_relation, moved_target, moved_count, COALESCE(moved_chunks, '[]')
+    FROM RelationshipMoves ORDER BY moved_id
+    """))
+    cursor.execute(conn.drop_temporary('RelationshipMoves'))
+
+
+def merge_json_attributes(cursor, conn):
+    """
+    JSON 存储的属性：同一保留实体的所有重复实体的属性先在内存中合并，再写入保留实体，保留实体已有的属性不变。
+    """
+    cursor.execute("""
+    SELECT m.canonical_id, d.attributes
+    FROM EntityMergeBatch m
+    JOIN Entities d ON d.entity_id = m.duplicate_id
+    WHERE d.attributes IS NOT NULL
+    ORDER BY m.duplicate_id
+    """)
+    patches = defaultdict(dict)
+    for row in cursor.fetchall():
+        for attr_name, attr_value in json.loads(row['attributes']).items():
+            patches[row['canonical_id']].setdefault(attr_name, attr_value)
+
+    merged_attributes = conn.json_merge_patch('%s', "COALESCE(attributes, '{}')")
+    cursor.executemany(
+        f"UPDATE Entities SET attributes = {merged_attributes} WHERE entity_id = %s",
+        [(json.dumps(patch, ensure_ascii=False), canonical_id) for canonical_id, patch in patches.items()]
+    )
+
+
+def apply_merge_batch(cursor, conn):
+    """
+    按 EntityMergeBatch 合并一批实体：属性和关系转到保留实体后删除重复实体，语句数与重复实体数无关。
+    """
+    # 保留实体已有的属性不覆盖，多个重复实体有同名属性时取先入库的一个
+    cursor.execute(conn.upsert(
+        'EntityAttributes', ('entity_id', 'attribute_name', 'attribute_value'), ('entity_id', 'attribute_name'),
+        select="""
+        SELECT m.canonical_id, a.attribute_name, a.attribute_value
+        FROM EntityAttributes a
+        JOIN EntityMergeBatch m ON a.entity_id = m.duplicate_id
+        ORDER BY a.id
+        """
+    ))
+    cursor.execute("DELETE FROM EntityAttributes WHERE entity_id IN (SELECT duplicate_id FROM EntityMergeBatch)")
+
+    merge_json_attributes(cursor, conn)
+    move_relationships(cursor, conn, 'source_id')
+    move_relationships(cursor, conn, 'target_id')
+
+    cursor.execute("DELETE FROM Entities WHERE entity_id IN (SELECT duplicate_id FROM EntityMergeBatch)")
+
+
+def apply_merge_map(cursor, conn, batch_size=5000):
+    """
+    按 EntityMergeMap 合并实体，每 batch_size 个重复实体一个事务。返回合并掉的实体数。
+    映射中的保留实体不能同时是重复实体（load_merge_map 会展开链式映射）。
+    """
+    cursor.execute(conn.drop_temporary('EntityMergeBatch'))
+    cursor.execute(MERGE_BATCH_DDL)
+
+    merged = 0
+    last_id = -1
+    while True:
+        cursor.execute("DELETE FROM EntityMergeBatch")
+        cursor.execute("""
+        INSERT INTO EntityMergeBatch (duplicate_id, canonical_id)
+        SELECT duplicate_id, canonical_id FROM EntityMergeMap
+        WHERE duplicate_id > %s
+        ORDER BY duplicate_id
+        LIMIT %s
+        """, (last_id, batch_size))
+        if cursor.rowcount <= 0:
+            break
+        count = cursor.rowcount
+
+        cursor.execute("SELECT MAX(duplicate_id) AS last_id FROM EntityMergeBatch")
+        last_id = cursor.fetchone()['last_id']
+
+        try:
+            apply_merge_batch(cursor, conn)
+            conn.commit()
+            merged += count
+            logging.info(f"Merged {merged} duplicate entities")
+        except Error as e:
+            conn.rollback()
+            logging.error(f"Error merging batch ending at entity {last_id}: {e}")
+
+    cursor.execute(conn.drop_temporary('EntityMergeBatch'))
+    cursor.execute(conn.drop_temporary('EntityMergeMap'))
+    return merged
+
+
+def merge_normalized_names(cursor, conn, batch_size=5000):
+    """
+    按 (实体类型, 规范化名称) 分块，块内实体一次性合并到 entity_id 最小的实体，返回合并掉的实体数。
+    只在写法上有差异的名称在这里合并，语义相似度计算只需处理真正有歧义的名称。
+    """
+    normalizer = NameNormalizer(MERGE_CONFIG['name_suffixes'], MERGE_CONFIG['traditional_to_simplified'])
+    index = build_blocking_index(cursor, normalizer)
+    groups = index.groups()
+    for ids in groups[:10]:
+        logging.info(f"Normalized name group: {[index.names[entity_id] for entity_id in ids]}")
+    logging.info(f"Found {len(groups)} groups of entities with the same normalized name.")
+
+    load_merge_map(cursor, conn, index.merge_map())
+    return apply_merge_map(cursor, conn, batch_size)
+
 
 def merge_duplicate_entities():
-    conn = pymysql.connect(
-        host=DB_CONFIG['host'],
-        user=DB_CONFIG['user'],
-        password=DB_CONFIG['password'],
-        database=DB_CONFIG['database'],
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    conn = connect_storage()
     cursor = conn.cursor()
 
     try:
-        # 查找具有相同名称的实体
-        cursor.execute("""
-        SELECT entity_name, GROUP_CONCAT(entity_id) AS entity_ids
-        FROM Entities 
-        GROUP BY entity_name 
-        HAVING COUNT(*) > 1
-        """)
-        duplicate_entities = cursor.fetchall()
-
-        for entity in duplicate_entities:
-            entity_name = entity['entity_name']
-            entity_ids = entity['entity_ids']
-            entity_id_list = entity_ids.split(',')
-            primary_entity_id = entity_id_list[0]  # 将第一个实体作为主实体
-
-            for duplicate_entity_id in entity_id_list[1:]:
-                # 合并属性
-                cursor.execute("""
-                SELECT attribute_name, attribute_value 
-                FROM EntityAttributes 
-                WHERE entity_id = %s
-                """, (duplicate_entity_id,))
-
-                for attr in cursor.fetchall():
-                    attr_name = attr['attribute_name']
-                    attr_value = attr['attribute_value']
-                    try:
-                        cursor.execute("""
-                        INSERT INTO EntityAttributes (entity_id, attribute_name, attribute_value) 
-                        VALUES (%s, %s, %s)
-                        """, (primary_entity_id, attr_name, attr_value))
-                    except pymysql.IntegrityError:
-                        # 如果属性已经存在，则跳过
-                        logging.info(f"Attribute {attr_name} already exists for entity {primary_entity_id}, skipping.")
-
-                # 合并关系
-                cursor.execute("""
-                UPDATE Relationships 
-                SET source_id = %s 
-                WHERE source_id = %s
-                """, (primary_entity_id, duplicate_entity_id))
-
-                cursor.execute("""
-                UPDATE Relationships 
-                SET target_id = %s 
-                WHERE target_id = %s
-                """, (primary_entity_id, duplicate_entity_id))
-
-                # 删除重复的实体前先删除相关的属性
-                cursor.execute("""
-                DELETE FROM EntityAttributes 
-                WHERE entity_id = %s
-                """, (duplicate_entity_id,))
-
-                # 删除重复的实体
-                cursor.execute("""
-                DELETE FROM Entities 
-                WHERE entity_id = %s
-                """, (duplicate_entity_id,))
-
-            logging.info(f"Merged entities with name '{entity_name}' into entity {primary_entity_id}.")
-
-        conn.commit()
-        logging.info("Duplicate entity merging completed successfully.")
+        # 查找具有相同名称的实体，建立重复实体到保留实体的映射
+        duplicates = build_name_merge_map(cursor, conn)
+        logging.info(f"Found {duplicates} entities sharing a name with another entity.")
+
+        merged = apply_merge_map(cursor, conn, MERGE_CONFIG['batch_size'])
+        logging.info(f"Duplicate entity merging completed successfully, {merged} entities merged.")
+
+        if MERGE_CONFIG['normalize_names']:
+            merged = merge_normalized_names(cursor, conn, MERGE_CONFIG['batch_size'])
+            logging.info(f"Normalized name merging completed, {merged} entities merged.")
 
     except Error as e:
         logging.error(f"An error occurred during merging: {e}")
@@ -0,0 +1,72 @@
+import random
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+MERSENNE_PRIME = (1 << 61) - 1
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+class NearDuplicateIndex:
+    """
+    基于字符 shingle 的 MinHash + LSH 分桶索引，用于发现内容近似重复的文本块。
+    只有代表块（首次出现的内容）被加入索引，后续文本块与其估计 Jaccard 相似度达到 threshold 即视为重复。
+    """
+
+    def __init__(self, threshold=0.85, shingle_size=5, num_perm=128, bands=16, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands.")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        permutations = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+        # 每行一个排列的 (a, b)，按列广播到所有 shingle 哈希上
+        self.perm_a = np.array([a for a, _ in permutations], dtype=np.uint64)[:, None]
+        self.perm_b = np.array([b for _, b in permutations], dtype=np.uint64)[:, None]
+        self.buckets = defaultdict(list)  # (band 序号, band 哈希) -> [代表块序号]
+        self.signatures = {}  # 代表块序号 -> MinHash 签名
+
+    def shingles(self, text):
+        text = WHITESPACE_PATTERN.sub('', text)
+        if len(text) <= self.shingle_size:
+            return {zlib.crc32(text.encode('utf-8'))}
+        return {zlib.crc32(text[i:i + self.shingle_size].encode('utf-8'))
+                for i in range(len(text) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        """
+        返回长度为 num_perm 的 MinHash 签名。所有排列对所有 shingle 一次算出 (num_perm, shingle 数) 的矩阵再按行取最小值，
+        乘法在 uint64 上按 2^64 回绕后再对梅森素数取模。
+        """
+        hashes = np.fromiter(self.shingles(text), dtype=np.uint64)
+        return ((self.perm_a * hashes + self.perm_b) % np.uint64(MERSENNE_PRIME)).min(axis=1)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def query(self, signature):
+        """
+        返回估计相似度最高且不低于 threshold 的代表块 (序号, 相似度)，没有时返回 None。
+        """
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+
+        best = None
+        for index in candidates:
+            other = self.signatures[index]
+            similarity = int(np.count_nonzero(signature == other)) / self.num_perm
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (index, similarity)
+        return best
+
+    def add(self, index, signature):
+        self.signatures[index] = signature
+        for key in self._band_keys(signature):
+            self.buckets[key].append(index)
@@ -0,0 +1,103 @@
+import codecs
+import os
+import sqlite3
+import time
+from collections import Counter
+
+import chardet
+
+# 按长度从长到短排列，避免 UTF-32 LE 的 BOM 被误判为 UTF-16 LE
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# 每种检测路径的命中次数与耗时，用于观察跳过全量 chardet 带来的节省
+DETECTION_STATS = Counter()
+DETECTION_TIME = Counter()
+
+
+def detect_bytes_encoding(sample, complete=True, sample_size=64 * 1024):
+    """
+    依次尝试 BOM、严格 UTF-8 解码，最后只对前 sample_size 个字节运行 chardet。
+    complete=False 表示 sample 只是数据开头，末尾被截断的 UTF-8 多字节字符不算解码失败。
+    返回 (编码, 检测路径)，检测路径为 'bom'、'utf-8' 或 'sample'。
+    """
+    start = time.perf_counter()
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            method = 'bom'
+            break
+    else:
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(sample, final=complete)
+            encoding, method = 'utf-8', 'utf-8'
+        except UnicodeDecodeError:
+            encoding = chardet.detect(sample[:sample_size])['encoding'] or 'utf-8'
+            method = 'sample'
+
+    DETECTION_STATS[method] += 1
+    DETECTION_TIME[method] += time.perf_counter() - start
+    return encoding, method
+
+
+def detect_file_encoding(file_path, sample_size=64 * 1024, cache_path=None):
+    """
+    只读取文件开头 sample_size 个字节检测编码。
+    给定 cache_path（SQLite 文件，可与大模型响应缓存共用）时结果按文件路径、大小和修改时间持久化，
+    重跑同一个未修改的文件不再重复检测。
+    """
+    stat = os.stat(file_path)
+    cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    conn = None
+    if cache_path:
+        conn = sqlite3.connect(cache_path)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_encodings (
+            path TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            encoding TEXT,
+            PRIMARY KEY (path, size, mtime_ns)
+        )
+        """)
+        row = conn.execute("SELECT encoding FROM file_encodings WHERE path = ? AND size = ? AND mtime_ns = ?",
+                           cache_key).fetchone()
+        if row is not None:
+            conn.close()
+            DETECTION_STATS['cache'] += 1
+            return row[0], 'cache'
+
+    try:
+        with open(file_path, 'rb') as file:
+            sample = file.read(sample_size)
+        encoding, method = detect_bytes_encoding(sample, complete=stat.st_size <= sample_size,
+                                                 sample_size=sample_size)
+        if conn is not None:
+            # 同一路径只保留最新一次检测结果
+            conn.execute("DELETE FROM file_encodings WHERE path = ?", cache_key[:1])
+            conn.execute("INSERT INTO file_encodings (path, size, mtime_ns, encoding) VALUES (?, ?, ?, ?)",
+                         cache_key + (encoding,))
+            conn.commit()
+        return encoding, method
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def decode_bytes(content, sample_size=64 * 1024):
+    """
+    检测编码并解码整段字节，返回 (文本, 编码, 检测路径)。
+    """
+    encoding, method = detect_bytes_encoding(content, sample_size=sample_size)
+    return content.decode(encoding, errors='replace'), encoding, method
+
+
+def detection_report():
+    return ', '.join(
+        f"{method}: {count} calls, {DETECTION_TIME[method] * 1000:.1f} ms"
+        for method, count in DETECTION_STATS.most_common()
+    )
@@ -1,48 +1,20 @@
 import requests
 import json
-import chardet
 import os
-import chardet
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 
-# 自动检测文件编码并读取文本文件
-import chardet
-import os
-
-def read_text_file(file_path):
-    # 确保文件路径和文件名使用 utf-8 处理
-    try:
-        # 如果路径包含非 ASCII 字符，可以先规范化为 utf-8
-        file_path = os.fsdecode(file_path)
-        print(f"Normalized file path: {file_path}")
-    except UnicodeDecodeError as path_error:
-        print(f"Error decoding file path with utf-8: {path_error}")
-
-    # 以二进制模式读取文件并检测编码
-    with open(file_path, 'rb') as file:
-        raw_data = file.read()
-        detected_encoding = chardet.detect(raw_data)['encoding']
-        print(f"Detected Encoding: {detected_encoding}")
-
-    # 使用检测到的编码读取文件内容，处理无法解码的字符
-    try:
-        # 尝试使用检测到的编码读取文件
-        with open(file_path, 'r', encoding=detected_encoding, errors='ignore') as file:
-            return file.read()
-    except (UnicodeDecodeError, TypeError) as e:
-        print(f"Error reading file with detected encoding {detected_encoding}: {e}")
-
-        # 如果检测到的编码无效或读取失败，尝试使用其他常见编码
-        fallback_encodings = ['utf-8', 'utf-8-sig', 'gb18030']
-        for encoding in fallback_encodings:
-            try:
-                print(f"Trying fallback encoding: {encoding}")
-                with open(file_path, 'r', encoding=encoding, errors='ignore') as file:
-                    return file.read()
-            except UnicodeDecodeError as fallback_error:
-                print(f"Error with fallback encoding {encoding}: {fallback_error}")
-
-    # 如果所有编码尝试均失败，抛出异常
-    raise ValueError("Failed to read the file with any attempted encoding.")
+from config import EXTRACT_CONFIG
+from result_log import ResultLog, append_dead_letter, archive_legacy_output, text_hash
+from json_salvage import salvage_json
+from llm_cache import ResponseCache
+from llm_client import ModelClient
+from stream_parser import read_stream_text
+from chunker import context_chunk_budget, estimate_tokens, iter_chunks, iter_file_text
+from encoding_detect import decode_bytes, detect_file_encoding, detection_report
+from dedupe import NearDuplicateIndex
 
 
 # 获取最近上传的文件名
@@ -52,20 +24,91 @@ def get_latest_uploaded_file(directory):
         raise FileNotFoundError("No files found in the upload directory.")
     latest_file = max(files, key=os.path.getmtime)  # 根据修改时间找到最新的文件
     return latest_file
-def split_text(text, max_length=5000):
-    """
-    将文本按固定字数分割，每段最多 max_length 个字符。
 
-    :param text: 待分割的文本字符串
-    :param max_length: 每段的最大字符数，默认为 1000
-    :return: 分割后的文本段列表
-    """
-    segments = [text[i:i + max_length] for i in range(0, len(text), max_length)]
-    return segments
+# 批量抽取时附加在输入前的说明，放在固定前缀之后，不影响前缀缓存
+BATCH_RULE = """
+    ##Batch
+    输入包含多个以 ##Input[序号] 标记的文档片段，请分别对每个片段独立抽取，不要合并不同片段的结果;
+    返回一个 JSON 数组，每个元素形如 {"chunk": 序号, "result": 该片段按上述格式抽取的 JSON 数组};
+"""
+
+# 每次请求的 token 统计，用于衡量批量抽取和前缀复用的效果
+TOKEN_STATS = Counter()
+TOKEN_STATS_LOCK = threading.Lock()
+
+
+def build_full_prompt(goal, rule, input_text):
+    # goal 与 rule 始终作为字节完全一致的前缀放在最前面，支持前缀缓存的服务端可以复用
+    return f"##Goal{goal}\n##Rules{rule}\n{input_text}"
+
+
+def format_batch_input(chunks):
+    parts = [BATCH_RULE]
+    for index, text in chunks:
+        parts.append(f"##Input[{index}]{text.replace(chr(10), ' ')}\n")
+    return ''.join(parts)
+
+
+def log_token_usage(goal, rule, input_text, chunk_count):
+    prefix_tokens = estimate_tokens(f"##Goal{goal}\n##Rules{rule}\n")
+    input_tokens = estimate_tokens(input_text)
+    with TOKEN_STATS_LOCK:
+        TOKEN_STATS['requests'] += 1
+        TOKEN_STATS['chunks'] += chunk_count
+        TOKEN_STATS['prefix_tokens'] += prefix_tokens
+        TOKEN_STATS['input_tokens'] += input_tokens
+    print(f"Request tokens: prefix {prefix_tokens}, input {input_tokens}, "
+          f"total {prefix_tokens + input_tokens}, chunks {chunk_count}")
+
+
+def token_report():
+    requests_sent = TOKEN_STATS['requests'] or 1
+    return (f"{TOKEN_STATS['requests']} requests for {TOKEN_STATS['chunks']} chunks, "
+            f"{TOKEN_STATS['prefix_tokens']} prefix tokens + {TOKEN_STATS['input_tokens']} input tokens, "
+            f"{(TOKEN_STATS['prefix_tokens'] + TOKEN_STATS['input_tokens']) / requests_sent:.0f} tokens per request")
+
 
 # 发送请求给大模型并返回结果
-def get_extracted_info(prompt, model_url, goal, rule):
-    full_prompt = f"##Goal{goal}\n##Rules{rule}\n##Input{prompt.replace(chr(10), ' ')}"
+def get_extracted_info(prompt, model_url, goal, rule, cache=None, client=None, stream=False):
+    return request_extraction(f"##Input{prompt.replace(chr(10), ' ')}", prompt, model_url, goal, rule, 1,
+                              cache=cache, client=client, stream=stream)
+
+
+# 将多个较短的文本块打包到一次请求中，返回的每个结果以块序号标记
+def get_batch_extracted_info(chunks, model_url, goal, rule, cache=None, client=None, stream=False):
+    input_text = format_batch_input(chunks)
+    return request_extraction(input_text, input_text, model_url, goal, rule, len(chunks),
+                              cache=cache, client=client, stream=stream)
+
+
+def read_response(response, stream=False):
+    """
+    读取模型响应体，返回 (状态码, 文本)。
+    """
+    print("Response Status Code:", response.status_code)
+    if stream and response.status_code == 200:
+        # 流式读取响应，边接收边解码，不在内存中保留原始字节
+        response_text = read_stream_text(response)
+        print(f"Streamed {len(response_text)} characters")
+    else:
+        response_text, encoding, method = decode_bytes(response.content)
+        print(f"Detected Encoding: {encoding} (via {method})")
+        print("Response Content:", response_text)  # 调试信息
+    return response.status_code, response_text
+
+
+def request_extraction(input_text, cache_text, model_url, goal, rule, chunk_count,
+                       cache=None, client=None, stream=False):
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(cache_text, model_url, goal, rule)
+        cached_text = cache.get(cache_key)
+        if cached_text is not None:
+            print("Cache hit, skipping model call")
+            return cached_text
+
+    full_prompt = build_full_prompt(goal, rule, input_text)
+    log_token_usage(goal, rule, input_text, chunk_count)
     data = {"prompt": full_prompt}
     json_data = json.dumps(data, ensure_ascii=False)
     wrapped_data = {
@@ -75,50 +118,209 @@ def get_extracted_info(prompt, model_url, goal, rule):
     headers = {
         'Content-Type': 'application/x-www-form-urlencoded',
     }
-    response = requests.post(model_url, data=wrapped_data, headers=headers)
-    print("Response Status Code:", response.status_code)
-    detected_encoding = chardet.detect(response.content)
-    print("Detected Encoding:", detected_encoding)
-    encoding = detected_encoding['encoding'] if detected_encoding['encoding'] else 'utf-8'
-    response_text = response.content.decode(encoding)
-    print("Response Content:", response_text)  # 调试信息
+    if client is not None:
+        status_code, response_text = client.post(model_url, read=lambda response: read_response(response, stream),
+                                                 data=wrapped_data, headers=headers, stream=stream)
+    else:
+        response = requests.post(model_url, data=wrapped_data, headers=headers, timeout=(10, 300), stream=stream)
+        status_code, response_text = read_response(response, stream)
+
+    if status_code != 200:
+        raise ValueError(f"Error from model: {status_code} {response_text}")
 
-    if response.status_code != 200:
-        raise ValueError(f"Error from model: {response.status_code} {response_text}")
+    if cache is not None:
+        cache.put(cache_key, response_text)
 
     return response_text
 
+
+class RateLimiter:
+    """
+    按固定间隔发放请求许可，保证每秒发出的请求数不超过 requests_per_second。
+    """
+
+    def __init__(self, requests_per_second=None):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.next_time = max(self.next_time, now)
+            delay = self.next_time - now
+            self.next_time += self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
 # 提取信息并保存为JSON格式，同时记录进度
-def extract_and_save_info(text_chunks, model_url, output_file, goal, rule, progress_file):
-    extracted_info = []
-    if os.path.exists(output_file):
-        with open(output_file, 'r', encoding='utf-8') as file:
-            extracted_info = json.load(file)
-
-    # 读取进度文件
-    if os.path.exists(progress_file):
-        with open(progress_file, 'r', encoding='utf-8') as file:
-            processed_ids = set(json.load(file))
-    else:
-        processed_ids = set()
+def extract_and_save_info(text_chunks, model_url, log_file, goal, rule, output_file=None, progress_file=None,
+                          max_workers=1, requests_per_second=None, fsync_every=20, cache=None, client=None,
+                          stream=False, dedupe_index=None,
+                          batch_chunk_chars=0, batch_max_chars=5000, batch_max_chunks=4,
+                          dead_letter_file='dead_letter_01.jsonl'):
+    """
+    并发抽取文本块，max_workers 控制同时在途的请求数，requests_per_second 控制请求速率。
+    结果按文本块顺序追加到 log_file（每行一条记录），断点续抽时扫描该日志跳过已处理且文本哈希一致的块，
+    分块设置变化导致文本不一致的块重新抽取，本次不再出现的块序号在压缩日志时删除。
+    抽取结束后压缩日志，并在指定 output_file 时导出旧版 JSON 数组格式的结果。
+    cache 为 ResponseCache 时，内容未变化的文本块直接使用缓存的模型响应；
+    client 为 ModelClient 时复用连接池并在接口故障时自动重试；
+    stream=True 时流式读取模型响应，边接收边解码，不在内存中保留原始字节；
+    dedupe_index 为 NearDuplicateIndex 时，近似重复的文本块直接复用代表块的抽取结果，不再调用模型；
+    batch_chunk_chars 大于 0 时，短于该长度的相邻文本块最多 batch_max_chunks 个、总长不超过 batch_max_chars 打包为一次请求。
+    格式有误的响应会先尝试修复，仍无法解析的连同块序号写入 dead_letter_file。
+    """
+    result_log = ResultLog(log_file, fsync_every=fsync_every)
+
+    # 兼容旧版本：日志为空时旧的 JSON 输出与进度文件无法按块序号导入，改名保留后重新抽取
+    if (not result_log.offsets and output_file and progress_file
+            and os.path.exists(output_file) and os.path.exists(progress_file)):
+        archive_legacy_output(output_file, progress_file)
+
+    limiter = RateLimiter(requests_per_second)
+
+    def fetch(chunk):
+        limiter.wait()
+        return get_extracted_info(chunk, model_url, goal, rule, cache=cache, client=client,
+                                  stream=stream)
 
-    for index, chunk in enumerate(text_chunks):
-        if index in processed_ids:
-            continue
+    def fetch_batch(chunks):
+        limiter.wait()
+        result = get_batch_extracted_info(chunks, model_url, goal, rule, cache=cache, client=client,
+                                          stream=stream)
+        try:
+            items, repaired = salvage_json(result)
+        except ValueError:
+            print(f"Error decoding batch JSON response: {result}")
+            return {}
+        results = {}
+        for item in items:
+            if not isinstance(item, dict) or item.get('result') is None:
+                continue
+            # 模型可能把序号写成字符串 "3"，或只返回单个对象而不是数组
+            try:
+                index = int(item.get('chunk'))
+            except (TypeError, ValueError):
+                continue
+            result = item['result']
+            if isinstance(result, str):
+                try:
+                    result, _ = salvage_json(result)
+                except ValueError:
+                    continue
+            results[index] = result if isinstance(result, list) else [result]
+        return results
 
-        result = get_extracted_info(chunk, model_url, goal, rule)
+    def save_result(index, chunk, result):
         try:
-            result_json = json.loads(result)
-            extracted_info.append(result_json)
-            processed_ids.add(index)
+            result_json, repaired = salvage_json(result)
+        except ValueError as e:
+            # 无法恢复的响应写入死信文件，并在日志中标记为已处理，避免续抽时重复调用模型
+            print(f"Error decoding JSON response for chunk {index}, moved to {dead_letter_file}")
+            append_dead_letter(dead_letter_file, index, result, str(e))
+            result_log.append(index, None, error=str(e), text_hash=text_hash(chunk))
+            return
+        if repaired:
+            print(f"Salvaged malformed JSON response for chunk {index}")
+        result_log.append(index, result_json, text_hash=text_hash(chunk))
+
+    saved_calls = 0
+
+    def save_pending(entry):
+        nonlocal saved_calls
+        index, chunk, future, duplicate_of, batched = entry
+        if batched:
+            results = future.result()
+            if index in results:
+                result_log.append(index, results[index], text_hash=text_hash(chunk))
+            else:
+                print(f"Chunk {index} missing from batch response, extracting it on its own")
+                save_result(index, chunk, fetch(chunk))
+            return
+        if duplicate_of is None:
+            save_result(index, chunk, future.result())
+            return
 
-            # 保存提取的信息和进度
-            with open(output_file, 'w', encoding='utf-8') as file:
-                json.dump(extracted_info, file, ensure_ascii=False, indent=4)
-            with open(progress_file, 'w', encoding='utf-8') as file:
-                json.dump(list(processed_ids), file, ensure_ascii=False, indent=4)
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON response: {result}")
+        # 代表块序号更小，按顺序写入时其结果已在日志中
+        record = result_log.get(duplicate_of)
+        if record is not None and record.get('result') is not None:
+            result_log.append(index, record['result'], duplicate_of=duplicate_of, text_hash=text_hash(chunk))
+            saved_calls += 1
+        else:
+            # 代表块抽取失败时退回为直接调用模型
+            save_result(index, chunk, fetch(chunk))
+
+    # 在途任务按提交顺序排队，队首完成后再写入，保证结果顺序与文本块顺序一致
+    pending = deque()
+    batch = []
+    seen = []
+
+    def flush_batch(executor):
+        # 批次中的块序号连续，必须先于后续块入队以保持写入顺序
+        if len(batch) == 1:
+            index, chunk = batch[0]
+            pending.append((index, chunk, executor.submit(fetch, chunk), None, False))
+        elif batch:
+            future = executor.submit(fetch_batch, list(batch))
+            for index, chunk in batch:
+                pending.append((index, chunk, future, None, True))
+        batch.clear()
+
+    def drain():
+        # 限制排队任务数量，避免一次性提交全部文本块
+        while len(pending) >= max_workers * 2:
+            save_pending(pending.popleft())
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for index, chunk in enumerate(text_chunks):
+                # 已处理的块也要加入去重索引，续抽时后续块才能找到它们
+                duplicate_of = None
+                if dedupe_index is not None:
+                    signature = dedupe_index.signature(chunk)
+                    match = dedupe_index.query(signature)
+                    if match:
+                        duplicate_of = match[0]
+                        print(f"Chunk {index} is a near-duplicate of chunk {duplicate_of} "
+                              f"(similarity {match[1]:.2f})")
+                    else:
+                        dedupe_index.add(index, signature)
+
+                seen.append(index)
+                if result_log.is_processed(index, text_hash(chunk)):
+                    continue
+                if index in result_log.offsets:
+                    print(f"Chunk {index} differs from the logged chunk (chunking settings changed?), "
+                          f"extracting it again")
+
+                if duplicate_of is None and len(chunk) < batch_chunk_chars:
+                    if (len(batch) >= batch_max_chunks
+                            or sum(len(text) for _, text in batch) + len(chunk) > batch_max_chars):
+                        flush_batch(executor)
+                        drain()
+                    batch.append((index, chunk))
+                    continue
+
+                flush_batch(executor)
+                future = executor.submit(fetch, chunk) if duplicate_of is None else None
+                pending.append((index, chunk, future, duplicate_of, False))
+                drain()
+
+            flush_batch(executor)
+            while pending:
+                save_pending(pending.popleft())
+
+        if dedupe_index is not None:
+            print(f"Near-duplicate detection saved {saved_calls} model calls")
+        # 旧分块设置下多出的块序号不再对应任何文本
+        result_log.retain(seen)
+        result_log.compact(json_output=output_file)
+    finally:
+        result_log.close()
 
 
 # 主函数
@@ -128,8 +330,10 @@ def main():
     file_path = get_latest_uploaded_file(upload_directory)  # 获取最新上传的文件路径
     print(f"Processing file: {file_path}")
     model_url = 'http://101.251.216.48:80/qwen2-110B-stream'
+    log_file = 'extracted_info_01.jsonl'
     output_file = 'extracted_info_01.json'
     progress_file = 'progress_01.json'
+    dead_letter_file = 'dead_letter_01.jsonl'
     goal = """
     ##Goal
     现在你是一名情报分析师，你的任务是从输入文档中提取所有实体及其属性，并描述实体之间的关系，提取的实体类型包括：国家（country）、人物（character）、组织与联盟（tissue）、机构（institution）、设施（facility）、设备与工具(Equipment and tools)、资源与物资(Resources and materials)、商品(commodity)、武器（weapon）、协议与条约（Agreements and treaties）、事件（incident）。返回json数组结构。
@@ -315,9 +519,51 @@ def main():
     ##input
 
     """
-    text = read_text_file(file_path)
-    text_chunks = split_text(text)
-    extract_and_save_info(text_chunks, model_url, output_file, goal, rule, progress_file)
+    # 流式读取上传文件，按段落与句子边界组块，块大小受模型上下文长度约束
+    encoding, method = detect_file_encoding(file_path, cache_path=EXTRACT_CONFIG['cache_path'])
+    print(f"Detected Encoding: {encoding} (via {method})")
+    max_tokens = context_chunk_budget(EXTRACT_CONFIG['model_context_tokens'], goal + rule,
+                                      EXTRACT_CONFIG['max_output_tokens'])
+    text_chunks = iter_chunks(iter_file_text(file_path, encoding),
+                              max_chars=EXTRACT_CONFIG['chunk_max_chars'],
+                              max_tokens=max_tokens,
+                              overlap=EXTRACT_CONFIG['chunk_overlap'])
+    if 0 < EXTRACT_CONFIG['batch_chunk_chars'] <= EXTRACT_CONFIG['chunk_max_chars'] // 2:
+        print(f"batch_chunk_chars ({EXTRACT_CONFIG['batch_chunk_chars']}) is at most half of chunk_max_chars "
+              f"({EXTRACT_CONFIG['chunk_max_chars']}), only the last chunk can be short enough to batch")
+    cache = ResponseCache(EXTRACT_CONFIG['cache_path'],
+                          max_bytes=EXTRACT_CONFIG['cache_max_bytes'],
+                          max_age=EXTRACT_CONFIG['cache_max_age_days'] * 86400,
+                          bypass=EXTRACT_CONFIG['cache_bypass'])
+    client = ModelClient(pool_size=EXTRACT_CONFIG['max_workers'],
+                         timeout=EXTRACT_CONFIG['http_timeout'],
+                         max_retries=EXTRACT_CONFIG['max_retries'],
+                         backoff_base=EXTRACT_CONFIG['backoff_base'],
+                         backoff_max=EXTRACT_CONFIG['backoff_max'],
+                         failure_threshold=EXTRACT_CONFIG['breaker_threshold'],
+                         cooldown=EXTRACT_CONFIG['breaker_cooldown'])
+    dedupe_index = None
+    if EXTRACT_CONFIG['dedupe_threshold']:
+        dedupe_index = NearDuplicateIndex(threshold=EXTRACT_CONFIG['dedupe_threshold'],
+                                          shingle_size=EXTRACT_CONFIG['dedupe_shingle_size'])
+    try:
+        extract_and_save_info(text_chunks, model_url, log_file, goal, rule, output_file, progress_file,
+                              max_workers=EXTRACT_CONFIG['max_workers'],
+                              requests_per_second=EXTRACT_CONFIG['requests_per_second'],
+                              fsync_every=EXTRACT_CONFIG['fsync_every'], cache=cache, client=client,
+                              stream=EXTRACT_CONFIG['stream'],
+                              dedupe_index=dedupe_index,
+                              batch_chunk_chars=EXTRACT_CONFIG['batch_chunk_chars'],
+                              batch_max_chars=EXTRACT_CONFIG['batch_max_chars'],
+                              batch_max_chunks=EXTRACT_CONFIG['batch_max_chunks'],
+                              dead_letter_file=dead_letter_file)
+        removed = cache.evict()
+        print(f"LLM cache stats: {cache.stats()}, evicted {removed} entries")
+        print(f"Encoding detection: {detection_report()}")
+        print(f"Token usage: {token_report()}")
+    finally:
+        client.close()
+        cache.close()
 
 if __name__ == "__main__":
     main()
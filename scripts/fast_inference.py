@@ -0,0 +1,135 @@
+import json
+import os
+
+import numpy as np
+
+# 导出的模型文件名
+FP32_MODEL_NAME = 'model_fp32.onnx'
+INT8_MODEL_NAME = 'model_int8.onnx'
+META_NAME = 'meta.json'
+
+
+def export_quantized_model(model_path, output_dir, opset=14):
+    """
+    把逐对相似度模型导出为 ONNX，再做 int8 动态量化（权重量化为 int8，激活值在运行时量化）。
+    导出的模型输入为 input_ids、attention_mask、token_type_ids，输出为“相似”类别的概率。
+    """
+    import torch
+    from modelscope.models import Model
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoTokenizer
+
+    class SimilarityHead(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            logits = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                token_type_ids=token_type_ids).logits
+            return torch.softmax(logits, dim=-1)[:, 1]
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SimilarityHead(Model.from_pretrained(model_path)).eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    example = tokenizer(['示例'], ['样例'], return_tensors='pt')
+    names = ['input_ids', 'attention_mask', 'token_type_ids']
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_NAME)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(example[name] for name in names), fp32_path, opset_version=opset,
+                          input_names=names, output_names=['score'],
+                          dynamic_axes={**{name: {0: 'batch', 1: 'sequence'} for name in names},
+                                        'score': {0: 'batch'}})
+    int8_path = os.path.join(output_dir, INT8_MODEL_NAME)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    return int8_path
+
+
+class OnnxPairScorer:
+    """
+    用 ONNX Runtime 运行 int8 量化后的相似度模型，按批计算名称对的相似度。
+    同一批内的名称对先按长度排序再切成 micro_batch 大小的小批，每个小批只补齐到批内最长的长度。
+    导出的模型只在 output_dir 中没有对应 model_path 的模型时生成一次；export=False 时只加载已导出的模型，
+    没有时抛出 FileNotFoundError。
+    """
+
+    def __init__(self, model_path, output_dir, threads=0, micro_batch=32, max_length=128, export=True):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_path = model_path
+        self.output_dir = output_dir
+        self.micro_batch = micro_batch
+        self.max_length = max_length
+        self.meta_path = os.path.join(output_dir, META_NAME)
+        self.meta = self.load_meta()
+        if self.meta.get('model_path') != model_path:
+            if not export:
+                raise FileNotFoundError(f"{output_dir} 中没有 {model_path} 导出的 ONNX 模型")
+            export_quantized_model(model_path, output_dir)
+            self.meta = {'model_path': model_path}
+            self.save_meta()
+
+        options = ort.SessionOptions()
+        # 单个请求内部并行计算，请求之间顺序执行，线程数默认与 CPU 核数相同
+        options.intra_op_num_threads = threads or os.cpu_count() or 1
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(os.path.join(output_dir, INT8_MODEL_NAME), options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+
+    def load_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {}
+        with open(self.meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save_meta(self):
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=4)
+
+    def score(self, pairs):
+        """
+        返回与 pairs 顺序一致的相似度分数列表。
+        """
+        order = sorted(range(len(pairs)), key=lambda k: len(pairs[k][0]) + len(pairs[k][1]))
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for start in range(0, len(order), self.micro_batch):
+            batch = order[start:start + self.micro_batch]
+            encoded = self.tokenizer([pairs[k][0] for k in batch], [pairs[k][1] for k in batch],
+                                     padding='longest', truncation=True, max_length=self.max_length,
+                                     return_tensors='np')
+            inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+            scores[batch] = self.session.run(['score'], inputs)[0]
+        return scores.tolist()
+
+    def verify(self, reference_score, pairs, max_delta=0.02, threshold=0.7, min_samples=1):
+        """
+        与原模型对比同一批名称对的分数，记录最大、平均误差和按 threshold 判定的一致率，返回误差是否在 max_delta 以内。
+        校验结果保存在 meta.json 中，同一个导出模型只校验一次；名称对少于 min_samples 时不校验也不记录，返回 False。
+        """
+        if 'accuracy' not in self.meta:
+            if len(pairs) < max(1, min_samples):
+                return False
+            report = accuracy_delta(self.score(pairs), [reference_score(*pair) for pair in pairs], threshold)
+            self.meta['accuracy'] = report
+            self.save_meta()
+        return self.meta['accuracy']['max_delta'] <= max_delta
+
+
+def accuracy_delta(fast_scores, reference_scores, threshold=0.7):
+    fast_scores = np.asarray(fast_scores, dtype=np.float64)
+    reference_scores = np.asarray(reference_scores, dtype=np.float64)
+    if not len(fast_scores):
+        return {"samples": 0, "max_delta": 0.0, "mean_delta": 0.0, "agreement": 1.0}
+    delta = np.abs(fast_scores - reference_scores)
+    return {
+        "samples": int(len(delta)),
+        "max_delta": float(delta.max()),
+        "mean_delta": float(delta.mean()),
+        "agreement": float(np.mean((fast_scores > threshold) == (reference_scores > threshold)))
+    }
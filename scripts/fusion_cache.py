@@ -0,0 +1,240 @@
+import os
+import sqlite3
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+def normalize_text(text):
+    # 缓存键只折叠全角/半角和首尾空白，不改变送入模型的名称
+    return unicodedata.normalize('NFKC', str(text)).strip()
+
+
+class FusionCacheStore(ABC):
+    """
+    知识融合缓存的公共部分：索引保存在缓存目录下的 SQLite 文件中，每个存储记录生成数据的模型路径，
+    模型路径变化时清空该存储。
+    """
+
+    store = None
+
+    def __init__(self, directory, model_path):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.model_path = model_path
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), timeout=30)
+        # WAL 模式下多个融合进程可以同时读取缓存
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (store TEXT PRIMARY KEY, model_path TEXT, settings TEXT)")
+        self.create_tables()
+        self.conn.commit()
+
+    @abstractmethod
+    def create_tables(self):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def check_model(self, settings=''):
+        """
+        模型路径或存储设置与缓存中记录的不同时清空存储，返回是否清空。
+        """
+        row = self.conn.execute("SELECT model_path, settings FROM meta WHERE store = ?", (self.store,)).fetchone()
+        if row == (self.model_path, settings):
+            return False
+        self.clear()
+        self.conn.execute("INSERT OR REPLACE INTO meta (store, model_path, settings) VALUES (?, ?, ?)",
+                          (self.store, self.model_path, settings))
+        self.conn.commit()
+        return row is not None
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class EmbeddingCache(FusionCacheStore):
+    """
+    名称向量的磁盘缓存。向量保存在内存映射的 embeddings.npy 中，每个名称占一行（槽位），
+    只有被访问的行会读入内存；名称到槽位的映射和最近访问时间保存在 SQLite 中。
+    槽位用满后复用最久未访问的名称的槽位（LRU）。
+    """
+
+    store = 'embeddings'
+
+    def __init__(self, directory, model_path, capacity=200000):
+        self.capacity = capacity
+        self.vectors = None
+        super().__init__(directory, model_path)
+        self.vectors_path = os.path.join(directory, 'embeddings.npy')
+        self.check_model(str(capacity))
+        if os.path.exists(self.vectors_path):
+            self.vectors = np.load(self.vectors_path, mmap_mode='r+')
+
+    def create_tables(self):
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            name_key TEXT PRIMARY KEY,
+            slot INTEGER UNIQUE,
+            accessed_at REAL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_accessed ON embeddings (accessed_at)")
+
+    def clear(self):
+        self.conn.execute("DELETE FROM embeddings")
+        self.vectors = None
+        vectors_path = os.path.join(self.directory, 'embeddings.npy')
+        if os.path.exists(vectors_path):
+            os.remove(vectors_path)
+
+    def get_many(self, names):
+        """
+        返回 {名称: 向量}，只包含已缓存的名称，命中的名称更新访问时间。
+        """
+        found = {}
+        if self.vectors is None:
+            self.misses += len(names)
+            return found
+        now = time.time()
+        touched = []
+        for name in names:
+            key = normalize_text(name)
+            row = self.conn.execute("SELECT slot FROM embeddings WHERE name_key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                continue
+            found[name] = np.array(self.vectors[row[0]])
+            touched.append((now, key))
+            self.hits += 1
+        self.conn.executemany("UPDATE embeddings SET accessed_at = ? WHERE name_key = ?", touched)
+        self.conn.commit()
+        return found
+
+    def _allocate(self, count):
+        # 槽位从 0 开始连续使用，淘汰的槽位立即被复用
+        used = self.conn.execute("SELECT COALESCE(MAX(slot) + 1, 0) FROM embeddings").fetchone()[0]
+        free = min(count, self.capacity - used)
+        slots = list(range(used, used + free))
+        if count > free:
+            # 复用最久未访问的名称的槽位
+            stale = self.conn.execute("SELECT name_key, slot FROM embeddings ORDER BY accessed_at LIMIT ?",
+                                      (count - free,)).fetchall()
+            self.conn.executemany("DELETE FROM embeddings WHERE name_key = ?", [(key,) for key, _ in stale])
+            slots.extend(slot for _, slot in stale)
+        return slots
+
+    def put_many(self, names, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.vectors is None:
+            self.vectors = np.lib.format.open_memmap(self.vectors_path, mode='w+', dtype=np.float32,
+                                                     shape=(self.capacity, vectors.shape[1]))
+        entries = {}
+        for name, vector in zip(names, vectors):
+            entries[normalize_text(name)] = vector
+        entries = list(entries.items())[-self.capacity:]
+
+        now = time.time()
+        new_entries = []
+        for key, vector in entries:
+            row = self.conn.execute("SELECT slot FROM embeddings WHERE name_key = ?", (key,)).fetchone()
+            if row is None:
+                new_entries.append((key, vector))
+            else:
+                self.vectors[row[0]] = vector
+                self.conn.execute("UPDATE embeddings SET accessed_at = ? WHERE name_key = ?", (now, key))
+
+        slots = self._allocate(len(new_entries))
+        for slot, (_, vector) in zip(slots, new_entries):
+            self.vectors[slot] = vector
+        self.vectors.flush()
+        self.conn.executemany("INSERT INTO embeddings (name_key, slot, accessed_at) VALUES (?, ?, ?)",
+                              [(key, slot, now) for slot, (key, _) in zip(slots, new_entries)])
+        self.conn.commit()
+
+
+class PairScoreCache(FusionCacheStore):
+    """
+    逐对相似度模型分数的磁盘缓存，键为两个规范化后的名称。条目数超过 max_entries 时按最近访问时间淘汰（LRU）。
+    新分数和访问时间先记在内存中，flush 时一次写入，避免长时间占用写锁。
+    """
+
+    store = 'pair_scores'
+
+    def __init__(self, directory, model_path, max_entries=2000000):
+        self.max_entries = max_entries
+        super().__init__(directory, model_path)
+        self.check_model()
+        self.pending = []
+        self.touched = []
+
+    def create_tables(self):
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS pair_scores (
+            text1 TEXT,
+            text2 TEXT,
+            score REAL,
+            accessed_at REAL,
+            PRIMARY KEY (text1, text2)
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_pair_scores_accessed ON pair_scores (accessed_at)")
+
+    def clear(self):
+        self.conn.execute("DELETE FROM pair_scores")
+
+    def get(self, name1, name2):
+        key = (normalize_text(name1), normalize_text(name2))
+        row = self.conn.execute("SELECT score FROM pair_scores WHERE text1 = ? AND text2 = ?", key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched.append((time.time(),) + key)
+        return row[0]
+
+    def put(self, name1, name2, score):
+        self.pending.append((normalize_text(name1), normalize_text(name2), float(score), time.time()))
+
+    def take_updates(self):
+        """
+        取出尚未写入的新分数和访问时间，由 merge_updates 合并到另一个进程的缓存对象中写入。
+        """
+        updates = (self.pending, self.touched)
+        self.pending, self.touched = [], []
+        return updates
+
+    def merge_updates(self, updates):
+        pending, touched = updates
+        self.pending.extend(pending)
+        self.touched.extend(touched)
+
+    def flush(self):
+        """
+        写入新分数和命中条目的访问时间并提交，条目数超过 max_entries 时删除最久未访问的条目。
+        """
+        self.conn.executemany("INSERT OR REPLACE INTO pair_scores (text1, text2, score, accessed_at) "
+                              "VALUES (?, ?, ?, ?)", self.pending)
+        self.conn.executemany("UPDATE pair_scores SET accessed_at = ? WHERE text1 = ? AND text2 = ?", self.touched)
+        self.pending, self.touched = [], []
+        excess = self.conn.execute("SELECT COUNT(*) FROM pair_scores").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.conn.execute("""
+            DELETE FROM pair_scores WHERE rowid IN (
+                SELECT rowid FROM pair_scores ORDER BY accessed_at LIMIT ?
+            )
+            """, (excess,))
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        super().close()
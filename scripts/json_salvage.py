@@ -0,0 +1,145 @@
+import json
+import re
+
+CODE_FENCE_PATTERN = re.compile(r'```(?:json|JSON)?\s*(.*?)\s*```', re.S)
+VALUE_DELIMITERS = ',}]\n'
+
+
+def strip_code_fences(text):
+    match = CODE_FENCE_PATTERN.search(text)
+    if match:
+        text = match.group(1)
+    # 去掉 JSON 前后的说明文字
+    starts = [i for i in (text.find('['), text.find('{')) if i >= 0]
+    if starts:
+        text = text[min(starts):]
+    return text.strip()
+
+
+def _parse_literal(token):
+    try:
+        json.loads(token)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def repair_json(text):
+    """
+    在字符串之外修复常见格式错误：删除 } 或 ] 前多余的逗号，给 600RPM 这类裸值加引号，
+    补上相邻值之间缺失的逗号（如示例中 "type":"武器" 与 "name" 之间）。
+    """
+    out = []
+    in_string = False
+    escape = False
+    last = ''  # 字符串外最后一个有意义的字符，字符串结束记为 '"'
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if in_string:
+            out.append(char)
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+                last = '"'
+            i += 1
+            continue
+
+        if char.isspace():
+            out.append(char)
+            i += 1
+            continue
+
+        if char == ',':
+            j = i + 1
+            while j < length and text[j].isspace():
+                j += 1
+            if j < length and text[j] in '}]':
+                i += 1
+                continue
+        elif char in '"{[' and last in ('"', '}', ']', 'v'):
+            out.append(',')
+        elif last == ':' and char not in '"{[':
+            # 冒号后的裸值：合法的数字或字面量保留，否则加引号
+            j = i
+            while j < length and text[j] not in VALUE_DELIMITERS:
+                j += 1
+            token = text[i:j].strip()
+            out.append(token if _parse_literal(token) else json.dumps(token, ensure_ascii=False))
+            last = 'v'
+            i = j
+            continue
+
+        if char == '"':
+            in_string = True
+        else:
+            last = char
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+def close_truncated(text):
+    """
+    截断的响应：回退到数组中最后一个完整闭合的对象（如一个完整的实体），再按当时未闭合的括号补齐。
+    返回从最长到最短的候选文本。
+    """
+    stack = []
+    in_string = False
+    escape = False
+    candidates = []
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append(char)
+        elif char in '}]':
+            if not stack:
+                break
+            stack.pop()
+            if char == '}' and stack and stack[-1] == '[':
+                closing = ''.join('}' if bracket == '{' else ']' for bracket in reversed(stack))
+                candidates.append(text[:i + 1] + closing)
+    return list(reversed(candidates))
+
+
+def salvage_json(text):
+    """
+    尽量从模型返回的文本中恢复 JSON，返回 (结果列表, 是否经过修复)。无法恢复时抛出 ValueError。
+    """
+    try:
+        value = json.loads(text)
+        return (value if isinstance(value, list) else [value]), False
+    except json.JSONDecodeError:
+        pass
+
+    text = repair_json(strip_code_fences(text))
+    # 模型仿照示例返回 {...},{...} 时补上外层数组
+    attempts = [text, f'[{text}]']
+    for attempt in attempts:
+        try:
+            value = json.loads(attempt)
+            return (value if isinstance(value, list) else [value]), True
+        except json.JSONDecodeError:
+            continue
+
+    wrapped = text if text.startswith('[') else f'[{text}'
+    for candidate in close_truncated(wrapped)[:20]:
+        try:
+            return json.loads(candidate), True
+        except json.JSONDecodeError:
+            continue
+
+    raise ValueError("Unable to recover JSON from model response.")
@@ -1,10 +1,19 @@
-import pymysql
+import argparse
+import multiprocessing
+import os
 import random
 import json
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from modelscope.pipelines import pipeline
 from modelscope.utils.logger import get_logger
 import torch
-from itertools import combinations
+from itertools import combinations, islice
+from clusters import DisjointSet, build_clusters, save_clusters
+from config import MERGE_CONFIG
+from fusion_cache import EmbeddingCache, PairScoreCache
+from name_blocking import CandidateIndex, NameNormalizer
+from similarity import calibration_report, embed_names, iter_pair_scores, iter_similar_pairs
+from storage import connect_storage
 
 
 def load_config(config_path='config.json'):
@@ -18,83 +27,501 @@ def load_config(config_path='config.json'):
 
 def connect_to_database(config):
     """
-    连接到数据库。
+    连接到数据库，使用 MySQL 后端时连接参数取自 config.json。
     """
-    connection = pymysql.connect(
-        host=config['db_host'],
-        user=config['db_user'],
-        password=config['db_password'],
-        database=config['db_name']
-    )
-    return connection
+    return connect_storage({
+        'host': config['db_host'],
+        'user': config['db_user'],
+        'password': config['db_password'],
+        'database': config['db_name']
+    })
 
 
 def fetch_entity_names_with_ids(connection, table_name, entity_type):
     """
     获取指定 entity_type 下的所有 entity_name 及其对应的 entity_id。
     """
-    cursor = connection.cursor()
+    cursor = connection.cursor(dictionary=False)
     cursor.execute(f"SELECT entity_id, entity_name FROM {table_name} WHERE entity_type = %s", (entity_type,))
     return cursor.fetchall()
 
 
-def main():
-    # 加载配置文件
-    config = load_config()
+def load_pipeline_backend(model_path, device):
+    """
+    ModelScope pipeline 逐对计算相似度。
+    """
+    # 传递 device 为字符串类型
+    nlp_model = pipeline(task='sentence-similarity', model=model_path, device=device)
 
-    # 连接到数据库
-    connection = connect_to_database(config)
+    def score_one(name1, name2):
+        similarity_result = nlp_model({'text': name1, 'text_target': name2})
+        return similarity_result['scores'][1]
 
-    # 检查 GPU 可用性并设置设备
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Using device: {device}")
+    return score_one
 
-    # 初始化模型
-    MODEL_PATH = config['local_model_path']
-    # 传递 device 为字符串类型
-    nlp_model = pipeline(task='sentence-similarity', model=MODEL_PATH, device=device)
-    logger = get_logger()
 
-    # 固定的实体类型列表
-    fixed_entity_types = ["事件", "人物", "武器", "资源与物资", "组织与联盟", "设施"]
+def load_onnx_backend(config, reference_pairs, device, export=True):
+    """
+    加载 int8 量化的 ONNX 相似度模型，首次使用时导出模型，并用 reference_pairs 与原模型对比分数。
+    export=False 时只加载已导出并校验过的模型，不导出也不校验（融合进程使用）。
+    缺少 onnxruntime、没有可用的导出模型或误差超过 onnx_max_delta 时返回 None，改用原模型。
+    """
+    try:
+        from fast_inference import OnnxPairScorer
+        scorer = OnnxPairScorer(config['local_model_path'], config.get('onnx_dir', 'onnx_model'),
+                                config.get('onnx_threads', 0), config.get('onnx_micro_batch', 32), export=export)
+    except (ImportError, FileNotFoundError) as e:
+        print(f"无法使用 ONNX 推理（{e}），改用原模型。")
+        return None
+
+    if not export:
+        accuracy = scorer.meta.get('accuracy')
+        if accuracy is None or accuracy['max_delta'] > config.get('onnx_max_delta', 0.02):
+            return None
+        return scorer.score
+
+    reference = []
+
+    def reference_score(name1, name2):
+        if not reference:
+            reference.append(load_pipeline_backend(config['local_model_path'], device))
+        return reference[0](name1, name2)
+
+    sample_size = config.get('onnx_check_samples', 200)
+    sample = reference_pairs[:sample_size]
+    if not scorer.verify(reference_score, sample, config.get('onnx_max_delta', 0.02),
+                         config.get('similarity_threshold', 0.7), min_samples=sample_size):
+        if 'accuracy' not in scorer.meta:
+            print(f"校验用的名称对不足（{len(sample)}/{sample_size}），改用原模型。")
+        else:
+            print(f"ONNX 模型与原模型的分数误差超出范围，改用原模型: {scorer.meta['accuracy']}")
+        return None
+    print(f"使用 int8 量化的 ONNX 模型，与原模型的分数误差: {scorer.meta['accuracy']}")
+    return scorer.score
+
+
+def uses_onnx(config, device):
+    return config.get('inference_backend', 'pipeline') == 'onnx' and device == 'cpu'
+
+
+def load_scorer(config, device, cache=None, export_onnx=True, reference_pairs=None):
+    """
+    返回为一批名称对计算相似度分数的函数 score_pairs([(name1, name2)]) -> [分数]。分数先查 cache（fusion_cache.PairScoreCache），
+    模型在第一次遇到缓存中没有的名称对时才加载。inference_backend 为 'onnx' 且使用 CPU 时改用量化后的 ONNX 模型，
+    导出后用 reference_pairs() 返回的名称对校验；export_onnx=False 时只使用已导出并校验过的 ONNX 模型。
+    """
+    backends = []
+
+    def load_backend():
+        if uses_onnx(config, device):
+            backend = load_onnx_backend(config, reference_pairs() if export_onnx and reference_pairs else [],
+                                        device, export_onnx)
+            if backend is not None:
+                return backend
+        score_one = load_pipeline_backend(config['local_model_path'], device)
+        return lambda batch: [score_one(name1, name2) for name1, name2 in batch]
+
+    def score_pairs(pairs):
+        scores = [cache.get(name1, name2) if cache is not None else None for name1, name2 in pairs]
+        missing = [k for k, similarity_score in enumerate(scores) if similarity_score is None]
+        if missing:
+            if not backends:
+                backends.append(load_backend())
+            for k, similarity_score in zip(missing, backends[0]([pairs[k] for k in missing])):
+                scores[k] = float(similarity_score)
+                if cache is not None:
+                    cache.put(*pairs[k], similarity_score)
+        return scores
+
+    return score_pairs
+
+
+def pairwise_similar_pairs(score_pairs, entity_data, threshold, pairs=None, batch_size=256):
+    """
+    逐对比较 pairs 中的名称（默认两两比较全部 entity_name），每 batch_size 对一起送入模型，
+    返回相似度大于 threshold 的 (id1, id2, 相似度)。
+    """
+    pairs = iter(pairs if pairs is not None else combinations(range(len(entity_data)), 2))
+    while True:
+        batch = list(islice(pairs, batch_size))
+        if not batch:
+            break
+        names = [(entity_data[i][1], entity_data[j][1]) for i, j in batch]
+        for (i, j), (name1, name2), similarity_score in zip(batch, names, score_pairs(names)):
+            print(f"'{name1}' 和 '{name2}' 的相似度为: {similarity_score:.4f}")
+            if similarity_score > threshold:
+                yield entity_data[i][0], entity_data[j][0], similarity_score
+
+
+def load_embedder(model_path, device, batch_size=64, cache=None):
+    """
+    返回把名称列表转为归一化向量矩阵的函数。向量先查 cache（fusion_cache.EmbeddingCache），
+    句向量模型在第一次遇到缓存中没有的名称时才加载。
+    """
+    models = []
+
+    def encode(names):
+        if not models:
+            models.append(pipeline(task='sentence-embedding', model=model_path, device=device))
+        return models[0](input={'source_sentence': list(names)})['text_embedding']
+
+    def embed(names):
+        return embed_names(encode, names, batch_size, cache)
+
+    return embed
+
+
+def embedding_similar_pairs(embed, entity_data, threshold, block_size=1024, pairs=None):
+    """
+    每个名称只编码一次，再分块计算余弦相似度矩阵（给定 pairs 时只计算候选对），
+    返回相似度大于 threshold 的 (id1, id2, 相似度)。
+    """
+    names = [name for _, name in entity_data]
+    embeddings = embed(names)
+    if pairs is None:
+        scored = iter_similar_pairs(embeddings, threshold, block_size)
+    else:
+        scored = iter_pair_scores(embeddings, pairs, threshold)
+    for i, j, similarity_score in scored:
+        print(f"'{names[i]}' 和 '{names[j]}' 的相似度为: {similarity_score:.4f}")
+        yield entity_data[i][0], entity_data[j][0], similarity_score
+
+
+def find_similar_pairs(score_pairs, embed, config, entity_data, pairs=None):
+    """
+    按 similarity_mode 选择逐对模型或句向量计算相似度，返回相似度大于对应阈值的 (id1, id2, 相似度)。
+    """
+    if config.get('similarity_mode', 'pairwise') == 'embedding':
+        return embedding_similar_pairs(embed, entity_data, config.get('embedding_threshold', 0.85),
+                                       config.get('similarity_block_size', 1024), pairs)
+    return pairwise_similar_pairs(score_pairs, entity_data, config.get('similarity_threshold', 0.7), pairs,
+                                  config.get('scoring_batch_size', 256))
+
+
+def build_candidate_index(config, entity_type, entity_data):
+    """
+    为一个实体类型的名称建立 n-gram 候选索引，名称先按 MERGE_CONFIG 的规则规范化。
+    """
+    normalizer = NameNormalizer(MERGE_CONFIG['name_suffixes'], MERGE_CONFIG['traditional_to_simplified'])
+    return CandidateIndex(entity_type, [name for _, name in entity_data], normalizer,
+                          config.get('blocking_ngram', 2), config.get('blocking_min_overlap', 0.5),
+                          config.get('blocking_max_df', 1000))
+
+
+def blocking_report(score_pairs, embed, connection, config, entity_types, report_path='blocking_report.json',
+                    seed=0):
+    """
+    每个类型随机抽取 blocking_sample_size 个实体做两两比较作为基准，统计其中的高相似度对有多少落在候选对中（召回率），
+    以及候选生成使全量计算的实体对减少的比例。
+    """
+    rng = random.Random(seed)
+    report = {}
+    for entity_type in entity_types:
+        entity_data = fetch_entity_names_with_ids(connection, config['table_name'], entity_type)
+        index = build_candidate_index(config, entity_type, entity_data)
+        candidates = sum(1 for _ in index.pairs())
+        total_pairs = len(entity_data) * (len(entity_data) - 1) // 2
+
+        sample_size = min(len(entity_data), config.get('blocking_sample_size', 300))
+        sample_data = [entity_data[k] for k in sorted(rng.sample(range(len(entity_data)), sample_size))]
+        positions = {entity_id: k for k, (entity_id, _) in enumerate(entity_data)}
+        positives = found = 0
+        for id1, id2, _ in find_similar_pairs(score_pairs, embed, config, sample_data):
+            positives += 1
+            found += index.is_candidate(*sorted((positions[id1], positions[id2])))
+
+        report[entity_type] = {
+            "entities": len(entity_data),
+            "all_pairs": total_pairs,
+            "candidate_pairs": candidates,
+            "pair_reduction": 1 - candidates / total_pairs if total_pairs else 0.0,
+            "sample_entities": sample_size,
+            "sample_similar_pairs": positives,
+            "recall": found / positives if positives else 1.0
+        }
+        print(f"{entity_type}: 候选对 {candidates}/{total_pairs}，减少 {report[entity_type]['pair_reduction']:.2%}；"
+              f"抽样 {sample_size} 个实体的 {positives} 个高相似度对中召回 {found} 个"
+              f"（召回率 {report[entity_type]['recall']:.2%}）")
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"候选生成报告已保存到 '{report_path}' 文件中。")
+    return report
+
+
+def sample_calibration_pairs(embed, entity_data, sample_size, block_size=1024, seed=0):
+    """
+    抽取用于校准的名称对：一半取余弦相似度最高的对（真正的候选集中在这里），一半随机抽取。
+    返回 [(name1, name2, 余弦相似度)]。
+    """
+    if len(entity_data) < 2:
+        return []
+    names = [name for _, name in entity_data]
+    embeddings = embed(names)
+
+    top_pairs = sorted(iter_similar_pairs(embeddings, 0.5, block_size), key=lambda pair: -pair[2])
+    sampled = {(i, j) for i, j, _ in top_pairs[:sample_size // 2]}
+
+    rng = random.Random(seed)
+    attempts = 0
+    while len(sampled) < sample_size and attempts < sample_size * 10:
+        i, j = sorted(rng.sample(range(len(names)), 2))
+        sampled.add((i, j))
+        attempts += 1
 
-    # 存储所有类型的高相似度实体对
-    all_high_similarity_pairs = {}
+    return [(names[i], names[j], float(embeddings[i] @ embeddings[j])) for i, j in sorted(sampled)]
+
+
+def calibrate(score_pairs, embed, connection, config, entity_types, report_path='similarity_calibration.json'):
+    """
+    用逐对模型为抽样的名称对打分，对照 0.7 的判定阈值给出向量模式下各余弦阈值的精确率、召回率，
+    并推荐 embedding_threshold。
+    """
+    samples = []
+    for entity_type in entity_types:
+        entity_data = fetch_entity_names_with_ids(connection, config['table_name'], entity_type)
+        sampled = sample_calibration_pairs(embed, entity_data, config.get('calibration_sample_size', 200),
+                                           config.get('similarity_block_size', 1024))
+        scores = score_pairs([(name1, name2) for name1, name2, _ in sampled])
+        samples.extend((cosine, similarity_score) for (_, _, cosine), similarity_score in zip(sampled, scores))
+
+    reference_threshold = config.get('similarity_threshold', 0.7)
+    rows, best_threshold = calibration_report(samples, reference_threshold)
+    print(f"校准样本数: {len(samples)}，逐对模型阈值: {reference_threshold}")
+    print(f"{'threshold':>10}{'precision':>11}{'recall':>9}{'f1':>8}{'agreement':>11}")
+    for row in rows:
+        print(f"{row['threshold']:>10.2f}{row['precision']:>11.3f}{row['recall']:>9.3f}"
+              f"{row['f1']:>8.3f}{row['agreement']:>11.3f}")
+    print(f"推荐的 embedding_threshold: {best_threshold}（当前配置: {config.get('embedding_threshold')}）")
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({"reference_threshold": reference_threshold, "samples": len(samples),
+                   "recommended_threshold": best_threshold, "thresholds": rows}, f, ensure_ascii=False, indent=4)
+    print(f"校准报告已保存到 '{report_path}' 文件中。")
+
+
+# 融合进程内的模型和缓存，由 init_fusion_worker 在每个进程启动时创建一次
+_worker_state = {}
+
+
+def init_fusion_worker(config, device, threads):
+    """
+    融合进程的初始化：固定计算线程数，打开分数缓存。模型在第一次遇到缓存中没有的名称对时加载，每个进程只加载一次。
+    ONNX 模型由主进程事先导出并校验，融合进程只加载。
+    """
+    torch.set_num_threads(threads)
+    config = dict(config, onnx_threads=threads)
+    cache = None
+    if config.get('fusion_cache', True):
+        cache = PairScoreCache(config.get('fusion_cache_dir', 'fusion_cache'), config['local_model_path'],
+                               config.get('pair_cache_max_entries', 2000000))
+    _worker_state.update(config=config, cache=cache, score_pairs=load_scorer(config, device, cache, export_onnx=False))
+
+
+def score_shard(entity_type, entity_data, pairs):
+    """
+    在融合进程中为一个分片的实体对打分，返回 (实体类型, 高相似度实体对, 新的缓存条目)，缓存由主进程统一写入。
+    """
+    config = _worker_state['config']
+    similar_pairs = list(pairwise_similar_pairs(_worker_state['score_pairs'], entity_data,
+                                                config.get('similarity_threshold', 0.7), pairs,
+                                                config.get('scoring_batch_size', 256)))
+    cache = _worker_state['cache']
+    return entity_type, similar_pairs, cache.take_updates() if cache is not None else None
+
+
+def iter_shards(connection, config, entity_types):
+    """
+    按实体类型、再按实体对切分融合工作，每个分片最多 shard_size 对，只带上分片用到的实体。
+    大类型（如“人物”）被切成多个分片，可以与其他类型的分片同时计算。
+    """
+    shard_size = config.get('shard_size', 20000)
+    for entity_type in entity_types:
+        entity_data = fetch_entity_names_with_ids(connection, config['table_name'], entity_type)
+        if config.get('candidate_blocking', True):
+            pairs = build_candidate_index(config, entity_type, entity_data).pairs()
+        else:
+            pairs = combinations(range(len(entity_data)), 2)
+
+        while True:
+            batch = list(islice(pairs, shard_size))
+            if not batch:
+                break
+            positions = sorted({position for pair in batch for position in pair})
+            local = {position: k for k, position in enumerate(positions)}
+            yield (entity_type, [tuple(entity_data[position]) for position in positions],
+                   [(local[i], local[j]) for i, j in batch])
+
+
+def sample_reference_pairs(connection, config, entity_types, seed=0):
+    """
+    从各类型的实体名称中随机抽取 onnx_check_samples 个互不相同的同类型名称对，用于校验 ONNX 模型。
+    各类型被抽中的概率与其实体数成正比；名称太少凑不满时返回的名称对少于 onnx_check_samples。
+    """
+    sample_size = config.get('onnx_check_samples', 200)
+    names_by_type = []
+    for entity_type in entity_types:
+        names = sorted({name for _, name in fetch_entity_names_with_ids(connection, config['table_name'], entity_type)})
+        if len(names) >= 2:
+            names_by_type.append(names)
+    if not names_by_type:
+        return []
+
+    rng = random.Random(seed)
+    weights = [len(names) for names in names_by_type]
+    sampled = set()
+    attempts = 0
+    while len(sampled) < sample_size and attempts < sample_size * 10:
+        names = rng.choices(names_by_type, weights)[0]
+        sampled.add(tuple(sorted(rng.sample(names, 2))))
+        attempts += 1
+    return sorted(sampled)
+
+
+def prepare_onnx_model(connection, config, entity_types, device):
+    """
+    多进程融合前在主进程中导出并校验 ONNX 模型，避免各融合进程同时导出到 onnx_dir、同时写 meta.json。
+    """
+    if uses_onnx(config, device):
+        load_onnx_backend(config, sample_reference_pairs(connection, config, entity_types), device)
+
+
+def find_all_similar_pairs_parallel(connection, config, entity_types, device, pair_cache=None,
+                                    clusters_path='entity_clusters.json'):
+    """
+    用 fusion_workers 个进程并行计算高相似度实体对。分片边生成边提交，同时在途的分片数有上限，
+    结果按完成顺序取回并合并到各类型的并查集中。
+    """
+    workers = config.get('fusion_workers', 1) or os.cpu_count() or 1
+    threads = config.get('worker_threads', 0) or max(1, (os.cpu_count() or 1) // workers)
+    print(f"使用 {workers} 个融合进程，每个进程 {threads} 个计算线程")
+
+    disjoint_sets = {entity_type: DisjointSet() for entity_type in entity_types}
+    prepare_onnx_model(connection, config, entity_types, device)
+
+    def collect(futures):
+        for future in futures:
+            entity_type, similar_pairs, cache_updates = future.result()
+            for id1, id2, similarity_score in similar_pairs:
+                disjoint_sets[entity_type].union(id1, id2)
+            if pair_cache is not None and cache_updates is not None:
+                pair_cache.merge_updates(cache_updates)
+
+    # 使用 spawn 启动进程，避免 fork 继承已初始化的 torch 线程池和数据库连接
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_fusion_worker, initargs=(config, device, threads)) as executor:
+        running = set()
+        for shard in iter_shards(connection, config, entity_types):
+            if len(running) >= workers * 2:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                collect(done)
+            running.add(executor.submit(score_shard, *shard))
+        collect(wait(running).done)
+
+    if pair_cache is not None:
+        pair_cache.flush()
+
+    all_clusters = {}
+    for entity_type in entity_types:
+        all_clusters[entity_type] = build_clusters(disjoint_sets[entity_type])
+        print(f"{entity_type}: 得到 {len(all_clusters[entity_type])} 个聚类")
+
+    save_clusters(clusters_path, all_clusters)
+    print(f"所有实体聚类已保存到 '{clusters_path}' 文件中。")
+
+
+def find_all_similar_pairs(score_pairs, embed, connection, config, entity_types, pair_cache=None,
+                           clusters_path='entity_clusters.json'):
+    """
+    逐个实体类型计算高相似度实体对，用并查集合并为聚类后保存到 entity_clusters.json。
+    """
+    # 存储所有类型的实体聚类
+    all_clusters = {}
 
     # 遍历所有实体类型
-    for entity_type in fixed_entity_types:
+    for entity_type in entity_types:
         print(f"正在处理实体类型: {entity_type}")
 
         # 获取该 entity_type 下的所有 entity_name 及其对应的 entity_id
         entity_data = fetch_entity_names_with_ids(connection, config['table_name'], entity_type)
 
-        # 以相似度大于 0.7 的词对存储 entity_id 的键值对
-        high_similarity_pairs = {}
+        # 只对共有足够 n-gram 的候选对计算相似度
+        index = None
+        if config.get('candidate_blocking', True):
+            index = build_candidate_index(config, entity_type, entity_data)
+        similar_pairs = find_similar_pairs(score_pairs, embed, config, entity_data,
+                                           index.pairs() if index is not None else None)
+
+        # 相似度大于阈值的实体对合并到同一个聚类
+        disjoint_set = DisjointSet()
+        for id1, id2, similarity_score in similar_pairs:
+            disjoint_set.union(id1, id2)
 
-        # 对所有的 entity_name 两两比较
-        for (id1, name1), (id2, name2) in combinations(entity_data, 2):
-            # 计算两个词汇的相似度
-            similarity_result = nlp_model({'text': name1, 'text_target': name2})
-            similarity_scores = similarity_result['scores']
+        if index is not None:
+            total_pairs = len(entity_data) * (len(entity_data) - 1) // 2
+            print(f"{entity_type}: 计算了 {index.candidate_count}/{total_pairs} 个候选对")
 
-            # 获取相似度分数
-            similarity_score = similarity_scores[1]
+        if pair_cache is not None:
+            pair_cache.flush()
 
-            # 如果相似度大于 0.7，将两个词的 entity_id 以键值对形式存储
-            if similarity_score > 0.7:
-                high_similarity_pairs[id1] = id2
-                print(f"'{name1}' 和 '{name2}' 的相似度为: {similarity_score:.4f}")
-            else:
-                print(f"'{name1}' 和 '{name2}' 的相似度为: {similarity_score:.4f}")
+        # 将当前类型的聚类加入到总的字典中
+        all_clusters[entity_type] = build_clusters(disjoint_set)
+        print(f"{entity_type}: 得到 {len(all_clusters[entity_type])} 个聚类")
 
-        # 将当前类型的高相似度词对加入到总的字典中
-        all_high_similarity_pairs[entity_type] = high_similarity_pairs
+    # 将所有类型的聚类以 JSON 格式保存
+    save_clusters(clusters_path, all_clusters)
+
+    print(f"所有实体聚类已保存到 '{clusters_path}' 文件中。")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find highly similar entities of each type.")
+    parser.add_argument('--calibrate', action='store_true',
+                        help="compare embedding similarity against the pairwise model and suggest a threshold")
+    parser.add_argument('--blocking-report', action='store_true',
+                        help="measure candidate blocking recall against exhaustive comparison on a sample")
+    args = parser.parse_args()
+
+    # 加载配置文件
+    config = load_config()
+
+    # 连接到数据库
+    connection = connect_to_database(config)
+
+    # 检查 GPU 可用性并设置设备
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Using device: {device}")
+
+    # 固定的实体类型列表
+    fixed_entity_types = ["事件", "人物", "武器", "资源与物资", "组织与联盟", "设施"]
+
+    # 初始化模型，模型在第一次遇到缓存中没有的名称时才加载
+    MODEL_PATH = config['local_model_path']
+    pair_cache = embedding_cache = None
+    if config.get('fusion_cache', True):
+        cache_dir = config.get('fusion_cache_dir', 'fusion_cache')
+        pair_cache = PairScoreCache(cache_dir, MODEL_PATH, config.get('pair_cache_max_entries', 2000000))
+        embedding_cache = EmbeddingCache(cache_dir, config['embedding_model_path'],
+                                         config.get('embedding_cache_capacity', 200000))
+    score_pairs = load_scorer(config, device, pair_cache,
+                              reference_pairs=lambda: sample_reference_pairs(connection, config, fixed_entity_types))
+    embed = load_embedder(config['embedding_model_path'], device, config.get('embedding_batch_size', 64),
+                          embedding_cache)
+    logger = get_logger()
 
-    # 将所有类型的高相似度词对以 JSON 格式保存
-    with open('high_similarity_pairs.json', 'w', encoding='utf-8') as f:
-        json.dump(all_high_similarity_pairs, f, ensure_ascii=False, indent=4)
+    if args.calibrate:
+        calibrate(score_pairs, embed, connection, config, fixed_entity_types)
+    elif args.blocking_report:
+        blocking_report(score_pairs, embed, connection, config, fixed_entity_types)
+    elif config.get('fusion_workers', 1) != 1 and config.get('similarity_mode', 'pairwise') == 'pairwise':
+        find_all_similar_pairs_parallel(connection, config, fixed_entity_types, device, pair_cache)
+    else:
+        find_all_similar_pairs(score_pairs, embed, connection, config, fixed_entity_types, pair_cache)
 
-    print(f"所有高相似度词对已保存到 'high_similarity_pairs.json' 文件中。")
+    for cache in (pair_cache, embedding_cache):
+        if cache is not None:
+            print(f"{cache.store} 缓存: {cache.stats()}")
+            cache.close()
 
     # 关闭数据库连接
     connection.close()
@@ -0,0 +1,105 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    以内容哈希为键的大模型响应缓存，保存在本地 SQLite 文件中。
+    键由文本块内容、goal/rule 提示词和模型地址共同计算，任一变化都会重新调用模型。
+    bypass=True 时跳过缓存读取但仍写入最新响应，可用于强制刷新。
+    """
+
+    def __init__(self, path, max_bytes=None, max_age=None, bypass=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age  # 秒
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            cache_key TEXT PRIMARY KEY,
+            response TEXT,
+            size INTEGER,
+            created_at REAL,
+            accessed_at REAL
+        )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(prompt, model_url, goal, rule):
+        digest = hashlib.sha256()
+        for part in (model_url, goal, rule, prompt):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def get(self, key):
+        if self.bypass:
+            return None
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT response, created_at FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE cache_key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self.conn.execute("""
+            INSERT OR REPLACE INTO responses (cache_key, response, size, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?)
+            """, (key, response, len(response.encode('utf-8')), now, now))
+            self.conn.commit()
+
+    def evict(self):
+        """
+        先删除超过 max_age 的条目，再按最近访问时间从旧到新删除，直到总大小不超过 max_bytes。
+        """
+        removed = 0
+        with self.lock:
+            if self.max_age:
+                cursor = self.conn.execute("DELETE FROM responses WHERE created_at < ?",
+                                           (time.time() - self.max_age,))
+                removed += cursor.rowcount
+
+            if self.max_bytes:
+                total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    stale_keys = []
+                    for cache_key, size in self.conn.execute(
+                            "SELECT cache_key, size FROM responses ORDER BY accessed_at"):
+                        if total <= self.max_bytes:
+                            break
+                        stale_keys.append((cache_key,))
+                        total -= size
+                    self.conn.executemany("DELETE FROM responses WHERE cache_key = ?", stale_keys)
+                    removed += len(stale_keys)
+
+            self.conn.commit()
+        return removed
+
+    def stats(self):
+        with self.lock:
+            entries, total = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": total}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
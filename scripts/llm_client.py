@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitBreaker:
+    """
+    连续失败次数达到 failure_threshold 后断开 cooldown 秒，期间所有请求暂停等待；
+    冷却结束后放行请求，成功一次即恢复，再次失败则重新断开。
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=60):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            delay = self.open_until - time.monotonic()
+        if delay > 0:
+            print(f"Circuit open, pausing requests for {delay:.1f}s")
+            time.sleep(delay)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.open_until = time.monotonic() + self.cooldown
+                print(f"Circuit opened after {self.failures} consecutive failures")
+
+
+class ModelClient:
+    """
+    复用连接池的大模型 HTTP 客户端。
+    每个请求带超时，遇到连接错误、超时、429 或 5xx 时按带抖动的指数退避重试，并通过熔断器在接口持续故障时暂停。
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size=10, timeout=(10, 300), max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 failure_threshold=5, cooldown=60):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def backoff(self, attempt):
+        # full jitter：在 [0, min(上限, 基数 * 2^attempt)] 内随机等待，避免并发请求同时重试
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def post(self, url, read=None, **kwargs):
+        """
+        发送 POST 请求。重试耗尽后，状态码错误返回最后一次响应，网络异常则重新抛出。
+        指定 read 时在同一次尝试中调用 read(response) 读取响应体并返回其结果，
+        流式响应读到一半时连接中断或超时同样计入熔断器并重试。
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.breaker.wait()
+            try:
+                response = self.session.post(url, **kwargs)
+                will_retry = response.status_code in self.RETRY_STATUS and attempt < self.max_retries
+                result = response if read is None or will_retry else read(response)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise
+                print(f"Request failed ({e}), retrying ({attempt + 1}/{self.max_retries})")
+            else:
+                if response.status_code not in self.RETRY_STATUS:
+                    self.breaker.record_success()
+                    return result
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    return result
+                print(f"Model returned {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+                response.close()
+            time.sleep(self.backoff(attempt))
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,101 @@
+import argparse
+import logging
+import time
+
+from schema import SCHEMA_VERSION, create_tables, get_schema_version, migrate
+from storage import DB_ERRORS as Error, connect_storage
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# 融合与导出阶段的热点查询，迁移前后各执行一次对比耗时
+BENCHMARK_QUERIES = [
+    ("data_merge: group by name", """
+    SELECT entity_name, COUNT(*) AS count FROM Entities GROUP BY entity_name HAVING COUNT(*) > 1
+    """),
+    ("knowfusion: filter by type", """
+    SELECT entity_id, entity_name FROM Entities WHERE entity_type = %s
+    """),
+    ("merge: relationships of entity", """
+    SELECT source_id, relation, target_id FROM Relationships WHERE source_id = %s OR target_id = %s
+    """),
+]
+
+BENCHMARK_TYPES = ["事件", "人物", "武器", "资源与物资", "组织与联盟", "设施"]
+
+
+def benchmark(cursor, sample_size=100):
+    """
+    执行热点查询并返回 {查询名称: 秒}。关系查询对样本实体逐个执行，按类型筛选对固定类型逐个执行。
+    """
+    cursor.execute("SELECT entity_id FROM Entities LIMIT %s", (sample_size,))
+    sample_ids = [row['entity_id'] for row in cursor.fetchall()]
+
+    timings = {}
+    for name, sql in BENCHMARK_QUERIES:
+        if sql.count('%s') == 2:
+            params_list = [(entity_id, entity_id) for entity_id in sample_ids]
+        elif sql.count('%s') == 1:
+            params_list = [(entity_type,) for entity_type in BENCHMARK_TYPES]
+        else:
+            params_list = [None]
+
+        start = time.perf_counter()
+        for params in params_list:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def print_timings(before, after):
+    print(f"{'query':<36}{'before (ms)':>14}{'after (ms)':>14}")
+    for name in after:
+        before_ms = f"{before[name] * 1000:.1f}" if name in before else '-'
+        print(f"{name:<36}{before_ms:>14}{after[name] * 1000:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upgrade the data_graph database schema in place.")
+    parser.add_argument('--drop-backup', action='store_true', help="drop the *_v1 tables left by the migration")
+    parser.add_argument('--no-benchmark', action='store_true', help="skip the before/after query timings")
+    args = parser.parse_args()
+
+    conn = None
+    cursor = None
+    try:
+        conn = connect_storage()
+        cursor = conn.cursor()
+        if conn.backend == 'sqlite':
+            # SQLite 数据库总是直接按最新版本创建，没有需要迁移的旧表
+            create_tables(cursor, conn.backend)
+            conn.commit()
+            logging.info(f"SQLite schema is at version {SCHEMA_VERSION}")
+            return
+
+        version = get_schema_version(cursor)
+        logging.info(f"Current schema version: {version}, target version: {SCHEMA_VERSION}")
+        if version >= SCHEMA_VERSION:
+            logging.info("Schema is already up to date.")
+            return
+
+        before = {} if args.no_benchmark or version == 0 else benchmark(cursor)
+        migrate(cursor, conn)
+        if not args.no_benchmark:
+            print_timings(before, benchmark(cursor))
+
+        if args.drop_backup:
+            cursor.execute("DROP TABLE IF EXISTS Relationships_v1, EntityAttributes_v1, Entities_v1")
+            logging.info("Dropped backup tables.")
+    except Error as e:
+        logging.error(f"Migration failed: {e}")
+        if conn:
+            conn.rollback()
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,9 @@
 from neo4j import GraphDatabase
-import pymysql
 import logging
 import re
-from config import DB_CONFIG, NEO4J_CONFIG  # 从配置文件中加载数据库配置
+import json
+from config import NEO4J_CONFIG  # 从配置文件中加载数据库配置
+from storage import DB_ERRORS, connect_storage
 
 # 定义不同类型的实体对应的标签
 ENTITY_LABELS = {
@@ -19,6 +20,9 @@ ENTITY_LABELS = {
     '国家': 'Country'
 }
 
+# 关系名为空（入库时缺失的关系存为 ''）时使用的关系类型，Cypher 不允许空的关系类型
+DEFAULT_RELATION = 'RELATED_TO'
+
 def sanitize_key(key):
     """Sanitize attribute keys by removing or replacing problematic characters."""
     sanitized = re.sub(r'[^\w]', '_', key)
@@ -56,39 +60,46 @@ class Neo4jHandler:
 
         logging.info(f"Inserted Entity: {entity_id}, Type: {entity_type}, Name: {entity_name}, Label: {label}, Attributes: {sanitized_attributes}")
 
-    def create_relationship(self, source_id, relation, target_id):
+    def create_relationship(self, source_id, relation, target_id, weight=1):
         with self.driver.session() as session:
-            session.execute_write(self._create_relationship, source_id, relation, target_id)
+            session.execute_write(self._create_relationship, source_id, relation, target_id, weight)
 
     @staticmethod
-    def _create_relationship(tx, source_id, relation, target_id):
-        # 使用实际的关系类型代替 'RELATION'
+    def _create_relationship(tx, source_id, relation, target_id, weight):
+        # 使用实际的关系类型代替 'RELATION'，出现次数作为边的权重
+        relation = relation or DEFAULT_RELATION
         query = (
             f"MATCH (a {{id: $source_id}}), (b {{id: $target_id}}) "
-            f"MERGE (a)-[r:`{relation}`]->(b)"
+            f"MERGE (a)-[r:`{relation}`]->(b) "
+            f"SET r.weight = $weight"
         )
-        tx.run(query, source_id=source_id, relation=relation, target_id=target_id)
-        logging.info(f"Inserted Relationship: {source_id} -[{relation}]-> {target_id}")
+        tx.run(query, source_id=source_id, relation=relation, target_id=target_id, weight=weight)
+        logging.info(f"Inserted Relationship: {source_id} -[{relation}]-> {target_id}, Weight: {weight}")
 
-# 从 MySQL 中读取数据
+# 从知识库（MySQL 或 SQLite）中读取数据
 def fetch_mysql_data():
     try:
-        conn = pymysql.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        cursor.execute("SELECT entity_id, entity_type, entity_name FROM Entities")
-        entities = cursor.fetchall()
+        conn = connect_storage()
+        cursor = conn.cursor(dictionary=False)
 
+        cursor.execute("SELECT entity_id, entity_type, entity_name, attributes FROM Entities")
+        attributes_dict = {}
+        entities = []
+        for entity_id, entity_type, entity_name, attributes in cursor.fetchall():
+            # JSON 存储的属性随实体一起读出
+            if attributes is not None:
+                attributes_dict[entity_id] = json.loads(attributes)
+            entities.append((entity_id, entity_type, entity_name))
+
+        # 两种存储方式可能并存（合并会把 EAV 属性转到已有 JSON 属性的保留实体上），属性行对所有实体都要读取；
+        # 同名属性以 JSON 中的值为准，属性行只补充缺少的键
         cursor.execute("SELECT entity_id, attribute_name, attribute_value FROM EntityAttributes")
         attributes_data = cursor.fetchall()
 
-        attributes_dict = {}
         for entity_id, attr_name, attr_value in attributes_data:
-            if entity_id not in attributes_dict:
-                attributes_dict[entity_id] = {}
-            attributes_dict[entity_id][attr_name] = attr_value
+            attributes_dict.setdefault(entity_id, {}).setdefault(attr_name, attr_value)
 
-        cursor.execute("SELECT source_id, relation, target_id FROM Relationships")
+        cursor.execute("SELECT source_id, relation, target_id, occurrence_count FROM Relationships")
         relationships = cursor.fetchall()
 
         cursor.close()
@@ -96,8 +107,8 @@ def fetch_mysql_data():
 
         return entities, attributes_dict, relationships
 
-    except pymysql.MySQLError as e:
-        logging.error(f"MySQL error: {e}")
+    except DB_ERRORS as e:
+        logging.error(f"Database error: {e}")
         return [], {}, []
 
 def import_data_to_neo4j(entities, attributes_dict, relationships):
@@ -108,8 +119,8 @@ def import_data_to_neo4j(entities, attributes_dict, relationships):
             attributes = attributes_dict.get(entity_id, {})
             neo4j_handler.create_entity(entity_id, entity_type, entity_name, attributes)
 
-        for source_id, relation, target_id in relationships:
-            neo4j_handler.create_relationship(source_id, relation, target_id)
+        for source_id, relation, target_id, weight in relationships:
+            neo4j_handler.create_relationship(source_id, relation, target_id, weight)
 
         logging.info("Data import to Neo4j completed successfully.")
 
@@ -0,0 +1,140 @@
+import logging
+import unicodedata
+from bisect import bisect_right
+from collections import defaultdict
+
+# 去掉的字符类别：标点（P）、符号（S）、空白与分隔符（Z）、控制字符（C）
+STRIPPED_CATEGORIES = ('P', 'S', 'Z', 'C')
+
+# 去掉后缀后名称至少保留的字符数，避免“大师”这类只剩空串或单字的名称被错误合并
+MIN_NAME_LENGTH = 2
+
+
+class NameNormalizer:
+    """
+    生成实体名称的规范化键：NFKC 折叠全角/半角、统一大小写、去掉标点空白，
+    可选地把繁体转为简体，并按实体类型去掉称谓等后缀。规范化键相同的同类型实体视为同一实体。
+    """
+
+    def __init__(self, suffixes=None, traditional_to_simplified=False):
+        self.converter = None
+        if traditional_to_simplified:
+            try:
+                import opencc
+                self.converter = opencc.OpenCC('t2s')
+            except ImportError:
+                logging.warning("opencc is not installed, traditional to simplified mapping is disabled.")
+
+        # 实体类型 -> 规范化后的后缀列表，按长度从长到短尝试，'*' 对所有类型生效
+        self.suffixes = {}
+        for entity_type, values in (suffixes or {}).items():
+            folded = {self.fold(value) for value in values} - {''}
+            self.suffixes[entity_type] = sorted(folded, key=len, reverse=True)
+
+    def fold(self, text):
+        text = unicodedata.normalize('NFKC', str(text)).casefold()
+        if self.converter is not None:
+            text = self.converter.convert(text)
+        return ''.join(char for char in text if not unicodedata.category(char).startswith(STRIPPED_CATEGORIES))
+
+    def strip_suffix(self, key, entity_type):
+        for suffix in self.suffixes.get(entity_type, []) + self.suffixes.get('*', []):
+            if key.endswith(suffix) and len(key) - len(suffix) >= MIN_NAME_LENGTH:
+                return key[:-len(suffix)]
+        return key
+
+    def key(self, entity_type, entity_name):
+        return self.strip_suffix(self.fold(entity_name), entity_type)
+
+
+class BlockingIndex:
+    """
+    内存中的分块索引：(实体类型, 规范化键) -> 实体 ID 列表。
+    """
+
+    def __init__(self, normalizer):
+        self.normalizer = normalizer
+        self.blocks = defaultdict(list)
+        self.names = {}  # 实体 ID -> 原始名称，用于输出合并示例
+
+    def add(self, entity_id, entity_type, entity_name):
+        if not entity_name:
+            return
+        key = self.normalizer.key(entity_type, entity_name)
+        if key:
+            self.blocks[(entity_type, key)].append(entity_id)
+            self.names[entity_id] = entity_name
+
+    def groups(self):
+        """
+        返回包含多个实体的块，每块按实体 ID 排序。
+        """
+        return [sorted(ids) for ids in self.blocks.values() if len(ids) > 1]
+
+    def merge_map(self):
+        """
+        每块以 entity_id 最小的实体为保留实体，返回 {重复实体: 保留实体}。
+        """
+        merge_map = {}
+        for ids in self.groups():
+            for duplicate_id in ids[1:]:
+                merge_map[duplicate_id] = ids[0]
+        return merge_map
+
+
+def build_blocking_index(cursor, normalizer):
+    cursor.execute("SELECT entity_id, entity_type, entity_name FROM Entities")
+    index = BlockingIndex(normalizer)
+    for row in cursor.fetchall():
+        index.add(row['entity_id'], row['entity_type'], row['entity_name'])
+    return index
+
+
+class CandidateIndex:
+    """
+    按字符 n-gram 建立的倒排索引，用于在相似度计算前生成候选实体对，代替全部两两比较。
+    两个名称共有的 n-gram 数不少于较短名称 n-gram 数的 min_overlap 倍时才成为候选对；
+    出现在超过 max_df 个名称中的 n-gram（如“公司”“部队”）区分度低，不参与候选生成，
+    以免其倒排列表退化为两两比较。
+    """
+
+    def __init__(self, entity_type, names, normalizer, ngram=2, min_overlap=0.5, max_df=1000):
+        self.ngram = ngram
+        self.min_overlap = min_overlap
+        self.grams = [self.name_grams(normalizer.key(entity_type, name or '')) for name in names]
+        self.candidate_count = 0
+
+        postings = defaultdict(list)
+        for position, grams in enumerate(self.grams):
+            for gram in grams:
+                postings[gram].append(position)
+        self.postings = {gram: positions for gram, positions in postings.items() if len(positions) <= max_df}
+
+    def name_grams(self, key):
+        # 比 n-gram 还短的名称整体作为一个 gram
+        if len(key) <= self.ngram:
+            return {key} if key else set()
+        return {key[i:i + self.ngram] for i in range(len(key) - self.ngram + 1)}
+
+    def _accept(self, shared, i, j):
+        return shared > 0 and shared >= self.min_overlap * min(len(self.grams[i]), len(self.grams[j]))
+
+    def pairs(self):
+        """
+        按名称位置返回候选对 (i, j)，i < j。生成的候选对数累计在 candidate_count 中。
+        """
+        self.candidate_count = 0
+        for i, grams in enumerate(self.grams):
+            shared = defaultdict(int)
+            for gram in grams:
+                positions = self.postings.get(gram, ())
+                for j in positions[bisect_right(positions, i):]:
+                    shared[j] += 1
+            for j in sorted(shared):
+                if self._accept(shared[j], i, j):
+                    self.candidate_count += 1
+                    yield i, j
+
+    def is_candidate(self, i, j):
+        shared = sum(1 for gram in self.grams[i] & self.grams[j] if gram in self.postings)
+        return self._accept(shared, i, j)
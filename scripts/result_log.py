@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+
+
+class ResultLog:
+    """
+    追加写入的抽取结果日志，每行一条 {"index": 文本块序号, "result": 抽取结果, "text_hash": 文本块哈希} 记录。
+    每条记录写入后立即 flush，每 fsync_every 条记录 fsync 一次；断点续抽时扫描日志即可得到已处理的块序号，
+    并用 text_hash 确认该序号对应的文本没有因分块设置变化而改变。
+    """
+
+    def __init__(self, path, fsync_every=20):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.offsets = {}  # 块序号 -> 记录在日志中的字节偏移
+        self.hashes = {}  # 块序号 -> 记录对应文本块的哈希
+        self.unsynced = 0
+        self._scan()
+        self.file = open(self.path, 'ab')
+
+    def _scan(self):
+        """
+        扫描已有日志，记录每个块序号的偏移量；崩溃时写了一半的尾部记录会被截断。
+        """
+        if not os.path.exists(self.path):
+            return
+
+        valid_end = 0
+        with open(self.path, 'rb') as file:
+            offset = 0
+            for line in file:
+                line_offset = offset
+                offset += len(line)
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    record = None
+                # 能解析但缺少块序号的行同样跳过，压缩时会被删除
+                if not isinstance(record, dict) or 'index' not in record:
+                    print(f"Skipping corrupted log record at offset {line_offset} in {self.path}")
+                    valid_end = offset
+                    continue
+                self.offsets[record['index']] = line_offset
+                self.hashes[record['index']] = record.get('text_hash')
+                valid_end = offset
+
+        if valid_end < os.path.getsize(self.path):
+            print(f"Truncating incomplete tail of {self.path} at offset {valid_end}")
+            with open(self.path, 'r+b') as file:
+                file.truncate(valid_end)
+
+    def is_processed(self, index, text_hash):
+        """
+        块序号已有记录且记录的文本哈希与当前文本块一致时返回 True。
+        """
+        return index in self.offsets and self.hashes.get(index) == text_hash
+
+    def retain(self, indexes):
+        """
+        只保留 indexes 中的块序号，其余记录在下次压缩时删除。
+        """
+        for index in set(self.offsets) - set(indexes):
+            del self.offsets[index]
+            self.hashes.pop(index, None)
+
+    def append(self, index, result, **extra):
+        record = {"index": index, "result": result}
+        record.update(extra)
+        line = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+        offset = self.file.tell()
+        self.file.write(line)
+        self.file.flush()
+        self.offsets[index] = offset
+        self.hashes[index] = extra.get('text_hash')
+
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def get(self, index):
+        """
+        按块序号读取单条记录，不存在时返回 None。
+        """
+        offset = self.offsets.get(index)
+        if offset is None:
+            return None
+        self.file.flush()
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            return json.loads(file.readline())
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def compact(self, json_output=None):
+        """
+        压缩日志：每个块序号只保留最后一条记录并按序号排序，先写临时文件再原子替换。
+        指定 json_output 时同时导出旧版的 JSON 数组格式结果。
+        """
+        self.close()
+
+        tmp_path = self.path + '.tmp'
+        offsets = {}
+        with open(self.path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for index in sorted(self.offsets):
+                src.seek(self.offsets[index])
+                offsets[index] = dst.tell()
+                dst.write(src.readline())
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(tmp_path, self.path)
+        self.offsets = offsets
+
+        if json_output:
+            export_json(self.path, json_output)
+
+        self.file = open(self.path, 'ab')
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def iter_records(path):
+    """
+    逐行读取结果日志，跳过无法解析的记录。
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping corrupted log record at line {line_number} in {path}")
+
+
+def export_json(log_path, json_output):
+    """
+    将结果日志导出为 [result, result, ...] 形式的 JSON 数组，逐条写入，不在内存中拼接整个数组。
+    """
+    tmp_path = json_output + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write('[\n')
+        first = True
+        for record in iter_records(log_path):
+            # 写入死信文件的块没有抽取结果
+            if record.get('result') is None:
+                continue
+            if not first:
+                file.write(',\n')
+            json.dump(record['result'], file, ensure_ascii=False, indent=4)
+            first = False
+        file.write('\n]\n')
+    os.replace(tmp_path, json_output)
+
+
+def archive_legacy_output(output_file, progress_file):
+    """
+    旧版本按完成顺序追加结果，JSON 解析失败的块在下次运行时重试并追加到末尾，
+    结果列表与已处理序号之间的对应关系无法还原，因此不导入结果日志。
+    旧的输出与进度文件改名为 *.legacy 保留，避免被本次导出覆盖，对应的块重新抽取。
+    """
+    for path in (output_file, progress_file):
+        os.replace(path, path + '.legacy')
+    print(f"Legacy results in {output_file} cannot be matched to chunks, kept as {output_file}.legacy; "
+          f"all chunks will be extracted again")
+
+
+def append_dead_letter(path, index, response, error):
+    """
+    记录无法解析的模型响应，保留块序号以便人工排查或重新抽取。
+    """
+    record = {"index": index, "error": error, "response": response}
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
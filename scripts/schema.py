@@ -0,0 +1,323 @@
+import logging
+
+# 当前代码对应的表结构版本
+SCHEMA_VERSION = 4
+
+# 版本 2 的基础表结构：整数自增主键，实体原有的 UUID 保存在 entity_uuid 中；
+# 索引与融合、导出阶段的查询对应：按名称分组、按类型筛选、按关系两端查找。
+# 之后的版本都通过 MIGRATIONS 中的升级函数在此基础上修改，新建数据库同样依次执行。
+ENTITIES_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    entity_id INT AUTO_INCREMENT PRIMARY KEY,
+    entity_uuid CHAR(36) NOT NULL,
+    entity_type VARCHAR(255),
+    entity_name VARCHAR(255),
+    UNIQUE KEY uk_entities_uuid (entity_uuid),
+    KEY idx_entities_type_name (entity_type, entity_name),
+    KEY idx_entities_name (entity_name)
+);
+"""
+
+ATTRIBUTES_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    entity_id INT NOT NULL,
+    attribute_name VARCHAR(255),
+    attribute_value VARCHAR(255),
+    FOREIGN KEY (entity_id) REFERENCES {entities}(entity_id),
+    UNIQUE KEY uk_attributes_entity_name (entity_id, attribute_name)
+);
+"""
+
+RELATIONSHIPS_DDL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    source_id INT NOT NULL,
+    relation VARCHAR(255),
+    target_id INT NOT NULL,
+    FOREIGN KEY (source_id) REFERENCES {entities}(entity_id),
+    FOREIGN KEY (target_id) REFERENCES {entities}(entity_id),
+    KEY idx_relationships_source (source_id, relation),
+    KEY idx_relationships_target (target_id)
+);
+"""
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS SchemaVersion (
+    version INT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# 常用属性键 -> 由 Entities.attributes 生成的带索引列，修改后需要新增一个迁移版本
+HOT_ATTRIBUTES = {
+    '时间': 'attr_time',
+    '地点': 'attr_location',
+    '职位': 'attr_position',
+    '国籍': 'attr_nationality',
+}
+
+# SQLite 后端没有历史版本，直接创建最新版本的表结构
+SQLITE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS Entities (
+        entity_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity_uuid TEXT NOT NULL UNIQUE,
+        entity_type TEXT,
+        entity_name TEXT,
+        attributes TEXT,
+        """ + ",\n        ".join(f"{column} TEXT GENERATED ALWAYS AS (json_extract(attributes, '$.\"{key}\"')) VIRTUAL"
+                                  for key, column in HOT_ATTRIBUTES.items()) + """
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_entities_type_name ON Entities (entity_type, entity_name)",
+    "CREATE INDEX IF NOT EXISTS idx_entities_name ON Entities (entity_name)",
+] + [
+    f"CREATE INDEX IF NOT EXISTS idx_entities_{column} ON Entities ({column})" for column in HOT_ATTRIBUTES.values()
+] + [
+    """
+    CREATE TABLE IF NOT EXISTS EntityAttributes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        entity_id INTEGER NOT NULL REFERENCES Entities (entity_id),
+        attribute_name TEXT,
+        attribute_value TEXT,
+        UNIQUE (entity_id, attribute_name)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS Relationships (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_id INTEGER NOT NULL REFERENCES Entities (entity_id),
+        relation TEXT NOT NULL DEFAULT '',
+        target_id INTEGER NOT NULL REFERENCES Entities (entity_id),
+        occurrence_count INTEGER NOT NULL DEFAULT 1,
+        source_chunks TEXT,
+        UNIQUE (source_id, relation, target_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_relationships_target ON Relationships (target_id)",
+]
+
+
+def relationship_upsert_sql(storage, select=None):
+    """
+    同一关系只保留一行：重复出现时累加次数，并把新的来源块并入 source_chunks。
+    select 为按 (源, 关系, 目标, 次数, 来源块) 顺序返回列的查询时，批量插入其结果。
+    """
+    return storage.upsert(
+        'Relationships',
+        ('source_id', 'relation', 'target_id', 'occurrence_count', 'source_chunks'),
+        ('source_id', 'relation', 'target_id'),
+        {
+            'occurrence_count': 'occurrence_count + excluded.occurrence_count',
+            'source_chunks': storage.json_array_union('source_chunks', 'excluded.source_chunks'),
+        },
+        select
+    )
+
+
+def table_exists(cursor, table_name, backend='mysql'):
+    if backend == 'sqlite':
+        cursor.execute("SELECT COUNT(*) AS count FROM sqlite_master WHERE type = 'table' AND name = %s",
+                       (table_name,))
+    else:
+        cursor.execute("""
+        SELECT COUNT(*) AS count FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+        """, (table_name,))
+    return fetch_value(cursor) > 0
+
+
+def column_exists(cursor, table_name, column_name):
+    cursor.execute("""
+    SELECT COUNT(*) AS count FROM information_schema.columns
+    WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table_name, column_name))
+    return fetch_value(cursor) > 0
+
+
+def index_exists(cursor, table_name, index_name):
+    cursor.execute("""
+    SELECT COUNT(*) AS count FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table_name, index_name))
+    return fetch_value(cursor) > 0
+
+
+def fetch_value(cursor):
+    # 兼容 DictCursor 与普通游标
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return next(iter(row.values())) if isinstance(row, dict) else row[0]
+
+
+def get_schema_version(cursor, backend='mysql'):
+    """
+    返回数据库当前的表结构版本：没有任何表时为 0，只有旧版 UUID 主键表时为 1。
+    """
+    if table_exists(cursor, 'SchemaVersion', backend):
+        cursor.execute("SELECT MAX(version) FROM SchemaVersion")
+        version = fetch_value(cursor)
+        if version:
+            return version
+    return 1 if table_exists(cursor, 'Entities', backend) else 0
+
+
+def set_schema_version(cursor, version, backend='mysql'):
+    cursor.execute(SCHEMA_VERSION_DDL)
+    ignore = 'OR IGNORE' if backend == 'sqlite' else 'IGNORE'
+    cursor.execute(f"INSERT {ignore} INTO SchemaVersion (version) VALUES (%s)", (version,))
+
+
+def create_tables(cursor, backend='mysql'):
+    """
+    创建最新版本的表结构。已存在旧版表时需要先运行 migrate_db.py 升级。
+    """
+    version = get_schema_version(cursor, backend)
+    if version == SCHEMA_VERSION:
+        return
+    if backend == 'sqlite':
+        for statement in SQLITE_DDL:
+            cursor.execute(statement)
+        set_schema_version(cursor, SCHEMA_VERSION, backend)
+        return
+    if version > 0:
+        raise RuntimeError(f"Database schema is at version {version}, expected {SCHEMA_VERSION}. "
+                           f"Run scripts/migrate_db.py to upgrade it.")
+
+    cursor.execute(ENTITIES_DDL.format(table='Entities'))
+    cursor.execute(ATTRIBUTES_DDL.format(table='EntityAttributes', entities='Entities'))
+    cursor.execute(RELATIONSHIPS_DDL.format(table='Relationships', entities='Entities'))
+    set_schema_version(cursor, 2)
+    for target in range(3, SCHEMA_VERSION + 1):
+        MIGRATIONS[target](cursor)
+        set_schema_version(cursor, target)
+
+
+def migrate_v1_to_v2(cursor):
+    """
+    将 UUID 字符串主键的旧表复制到整数主键的新表，再原子重命名；旧表保留为 *_v1 备份。
+    """
+    # 清理上次中断的迁移留下的新表
+    cursor.execute("DROP TABLE IF EXISTS Relationships_v2, EntityAttributes_v2, Entities_v2")
+    cursor.execute(ENTITIES_DDL.format(table='Entities_v2'))
+    cursor.execute(ATTRIBUTES_DDL.format(table='EntityAttributes_v2', entities='Entities_v2'))
+    cursor.execute(RELATIONSHIPS_DDL.format(table='Relationships_v2', entities='Entities_v2'))
+
+    cursor.execute("""
+    INSERT INTO Entities_v2 (entity_uuid, entity_type, entity_name)
+    SELECT entity_id, entity_type, entity_name FROM Entities
+    """)
+    logging.info(f"Copied {cursor.rowcount} entities")
+
+    cursor.execute("""
+    INSERT INTO EntityAttributes_v2 (entity_id, attribute_name, attribute_value)
+    SELECT e.entity_id, a.attribute_name, a.attribute_value
+    FROM EntityAttributes a
+    JOIN Entities_v2 e ON e.entity_uuid = a.entity_id
+    """)
+    logging.info(f"Copied {cursor.rowcount} attributes")
+
+    cursor.execute("""
+    INSERT INTO Relationships_v2 (source_id, relation, target_id)
+    SELECT s.entity_id, r.relation, t.entity_id
+    FROM Relationships r
+    JOIN Entities_v2 s ON s.entity_uuid = r.source_id
+    JOIN Entities_v2 t ON t.entity_uuid = r.target_id
+    """)
+    logging.info(f"Copied {cursor.rowcount} relationships")
+
+    cursor.execute("""
+    RENAME TABLE
+        Entities TO Entities_v1,
+        EntityAttributes TO EntityAttributes_v1,
+        Relationships TO Relationships_v1,
+        Entities_v2 TO Entities,
+        EntityAttributes_v2 TO EntityAttributes,
+        Relationships_v2 TO Relationships
+    """)
+
+
+def migrate_v2_to_v3(cursor):
+    """
+    关系按 (source_id, relation, target_id) 去重：重复行合并为一行并记录出现次数，
+    source_chunks 记录关系来自哪些文本块，迁移前的历史数据没有来源信息。
+    MySQL 的每条 DDL 语句都会隐式提交，中途失败后重新执行时跳过已完成的步骤。
+    """
+    if index_exists(cursor, 'Relationships', 'uk_relationships_triple'):
+        return
+
+    cursor.execute("UPDATE Relationships SET relation = '' WHERE relation IS NULL")
+    clauses = ["MODIFY relation VARCHAR(255) NOT NULL DEFAULT ''"]
+    if not column_exists(cursor, 'Relationships', 'occurrence_count'):
+        clauses.append("ADD COLUMN occurrence_count INT NOT NULL DEFAULT 1")
+    if not column_exists(cursor, 'Relationships', 'source_chunks'):
+        clauses.append("ADD COLUMN source_chunks JSON")
+    cursor.execute("ALTER TABLE Relationships " + ",\n    ".join(clauses))
+
+    cursor.execute("DROP TEMPORARY TABLE IF EXISTS RelationshipCounts")
+    cursor.execute("""
+    CREATE TEMPORARY TABLE RelationshipCounts AS
+    SELECT MIN(id) AS keep_id, SUM(occurrence_count) AS occurrences
+    FROM Relationships
+    GROUP BY source_id, relation, target_id
+    """)
+    cursor.execute("""
+    UPDATE Relationships r
+    JOIN RelationshipCounts c ON r.id = c.keep_id
+    SET r.occurrence_count = c.occurrences, r.source_chunks = COALESCE(r.source_chunks, JSON_ARRAY())
+    """)
+    cursor.execute("""
+    DELETE r FROM Relationships r
+    LEFT JOIN RelationshipCounts c ON r.id = c.keep_id
+    WHERE c.keep_id IS NULL
+    """)
+    logging.info(f"Removed {cursor.rowcount} duplicate relationships")
+    cursor.execute("DROP TEMPORARY TABLE RelationshipCounts")
+
+    cursor.execute("""
+    ALTER TABLE Relationships
+        ADD UNIQUE KEY uk_relationships_triple (source_id, relation, target_id)
+    """)
+
+
+def migrate_v3_to_v4(cursor):
+    """
+    Entities 增加可选的 attributes JSON 列，按 JSON 存储的实体一次读取即可得到全部属性，属性值不再受长度限制。
+    常用属性键生成虚拟列并建索引，便于按属性筛选；EntityAttributes 表保留，两种存储方式的属性在读取时合并。
+    """
+    clauses = ["ADD COLUMN attributes JSON"]
+    for key, column in HOT_ATTRIBUTES.items():
+        clauses.append(f"ADD COLUMN {column} VARCHAR(255) GENERATED ALWAYS AS "
+                       f"(LEFT(JSON_UNQUOTE(JSON_EXTRACT(attributes, '$.\"{key}\"')), 255)) VIRTUAL")
+        clauses.append(f"ADD KEY idx_entities_{column} ({column})")
+    cursor.execute("ALTER TABLE Entities " + ",\n    ".join(clauses))
+
+
+# 目标版本 -> 从上一版本升级的函数
+MIGRATIONS = {
+    2: migrate_v1_to_v2,
+    3: migrate_v2_to_v3,
+    4: migrate_v3_to_v4,
+}
+
+
+def migrate(cursor, conn):
+    """
+    从当前版本逐级升级到 SCHEMA_VERSION，每一级成功后记录版本号。仅用于 MySQL 后端。
+    """
+    version = get_schema_version(cursor)
+    if version == 0:
+        create_tables(cursor)
+        conn.commit()
+        logging.info(f"Created schema version {SCHEMA_VERSION}")
+        return
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        logging.info(f"Migrating schema from version {target - 1} to {target}")
+        MIGRATIONS[target](cursor)
+        set_schema_version(cursor, target)
+        conn.commit()
+
+    logging.info(f"Schema is at version {SCHEMA_VERSION}")
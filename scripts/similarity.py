@@ -0,0 +1,82 @@
+from itertools import islice
+
+import numpy as np
+
+
+def embed_names(encode, names, batch_size=64, cache=None):
+    """
+    分批计算名称的向量并做 L2 归一化，归一化后向量内积即余弦相似度。
+    encode 接收一批名称，返回形状为 (批大小, 维度) 的数组。
+    指定 cache（fusion_cache.EmbeddingCache）时只为缓存中没有的名称调用 encode，新算出的向量写回缓存。
+    """
+    if not names:
+        return np.zeros((0, 0), dtype=np.float32)
+    cached = cache.get_many(names) if cache is not None else {}
+    missing = list(dict.fromkeys(name for name in names if name not in cached))
+    if missing:
+        batches = [np.asarray(encode(missing[start:start + batch_size]), dtype=np.float32)
+                   for start in range(0, len(missing), batch_size)]
+        computed = np.concatenate(batches)
+        if cache is not None:
+            cache.put_many(missing, computed)
+        cached.update(zip(missing, computed))
+    embeddings = np.stack([cached[name] for name in names]).astype(np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def iter_similar_pairs(embeddings, threshold, block_size=1024):
+    """
+    分块计算相似度矩阵，返回 (i, j, 相似度)，i < j 且相似度大于 threshold。
+    每次只计算 block_size x block_size 的子矩阵，峰值内存与实体总数无关。
+    """
+    count = len(embeddings)
+    for row_start in range(0, count, block_size):
+        rows = embeddings[row_start:row_start + block_size]
+        for col_start in range(row_start, count, block_size):
+            scores = rows @ embeddings[col_start:col_start + block_size].T
+            if col_start == row_start:
+                # 对角块只取上三角，排除自身和重复的 (j, i)
+                scores = np.triu(scores, k=1)
+            for i, j in zip(*np.nonzero(scores > threshold)):
+                yield row_start + int(i), col_start + int(j), float(scores[i, j])
+
+
+def calibration_report(samples, reference_threshold=0.7, thresholds=None):
+    """
+    以逐对模型的判定（分数大于 reference_threshold）为参照，评估向量余弦相似度在各阈值下的精确率、召回率和 F1。
+    samples 为 [(余弦相似度, 逐对模型分数)]，返回 (各阈值的统计列表, F1 最高的阈值)。
+    """
+    if thresholds is None:
+        thresholds = np.round(np.arange(0.50, 0.99, 0.02), 2)
+    cosines = np.array([sample[0] for sample in samples])
+    labels = np.array([sample[1] > reference_threshold for sample in samples])
+
+    rows = []
+    best = None
+    for threshold in thresholds:
+        predicted = cosines > threshold
+        true_positive = int(np.sum(predicted & labels))
+        precision = true_positive / max(int(np.sum(predicted)), 1)
+        recall = true_positive / max(int(np.sum(labels)), 1)
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        rows.append({"threshold": float(threshold), "precision": precision, "recall": recall, "f1": f1,
+                     "agreement": float(np.mean(predicted == labels)) if len(samples) else 0.0})
+        if best is None or f1 > best["f1"]:
+            best = rows[-1]
+    return rows, (best["threshold"] if best else None)
+
+
+def iter_pair_scores(embeddings, pairs, threshold, batch_size=65536):
+    """
+    只对给定的候选对 (i, j) 计算余弦相似度，按 batch_size 对一批做向量化内积，返回相似度大于 threshold 的 (i, j, 相似度)。
+    """
+    pairs = iter(pairs)
+    while True:
+        batch = list(islice(pairs, batch_size))
+        if not batch:
+            break
+        left, right = np.array(batch, dtype=np.int64).T
+        scores = np.einsum('ij,ij->i', embeddings[left], embeddings[right])
+        for k in np.nonzero(scores > threshold)[0]:
+            yield int(left[k]), int(right[k]), float(scores[k])
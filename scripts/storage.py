@@ -0,0 +1,197 @@
+import os
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+
+from config import DB_CONFIG, STORAGE_CONFIG
+
+# 项目根目录，SQLite 数据库文件的相对路径以此为基准，与脚本的运行目录无关
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXCLUDED_PATTERN = re.compile(r'\bexcluded\.(\w+)')
+
+
+def mysql_values(expression):
+    # excluded.列名 -> MySQL 的 VALUES(列名)
+    return EXCLUDED_PATTERN.sub(r'VALUES(\1)', expression)
+
+
+def _error_classes(name):
+    # 只安装了一种数据库驱动时也能捕获异常
+    errors = [getattr(sqlite3, name)]
+    try:
+        import pymysql
+        errors.append(pymysql.MySQLError if name == 'Error' else getattr(pymysql, name))
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+# 两种后端的异常类，用于 except 子句
+DB_ERRORS = _error_classes('Error')
+INTEGRITY_ERRORS = _error_classes('IntegrityError')
+
+
+class Storage(ABC):
+    """
+    数据库连接的薄封装，各脚本统一通过它读写知识库。
+    SQL 按 MySQL 语法书写、使用 %s 占位符；方言不同的部分（插入冲突、JSON 函数）由下面的方法生成。
+    对象本身提供 commit/rollback/close，可以直接当作连接对象传给已有函数。
+    """
+
+    backend = None
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @abstractmethod
+    def cursor(self, dictionary=True):
+        pass
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+    @abstractmethod
+    def upsert(self, table, columns, key_columns, updates=None, select=None):
+        """
+        生成按唯一键冲突处理的插入语句。updates 为 {列名: 表达式}，表达式中用 excluded.列名 引用待插入的值，
+        直接写列名引用已有的值；updates 为空时冲突的行被忽略。指定 select 时插入该查询的结果而不是一行参数。
+        """
+
+    @abstractmethod
+    def drop_temporary(self, table):
+        pass
+
+    @abstractmethod
+    def json_merge_patch(self, target, patch):
+        pass
+
+    @abstractmethod
+    def json_array_union(self, target, values):
+        """
+        合并两个 JSON 数组并去掉重复元素。
+        """
+
+
+class MySQLStorage(Storage):
+    backend = 'mysql'
+
+    def __init__(self, db_config):
+        import pymysql
+
+        self.dict_cursor = pymysql.cursors.DictCursor
+        super().__init__(pymysql.connect(
+            host=db_config['host'],
+            user=db_config['user'],
+            password=db_config['password'],
+            database=db_config['database'],
+            port=db_config.get('port', 3306),
+            charset='utf8mb4'
+        ))
+
+    def cursor(self, dictionary=True):
+        return self.conn.cursor(self.dict_cursor if dictionary else None)
+
+    def upsert(self, table, columns, key_columns, updates=None, select=None):
+        source = select or f"VALUES ({', '.join(['%s'] * len(columns))})"
+        if not updates:
+            return f"INSERT IGNORE INTO {table} ({', '.join(columns)}) {source}"
+        assignments = ', '.join(f"{column} = {mysql_values(expression)}"
+                                for column, expression in updates.items())
+        return f"INSERT INTO {table} ({', '.join(columns)}) {source} ON DUPLICATE KEY UPDATE {assignments}"
+
+    def drop_temporary(self, table):
+        # 带 TEMPORARY 关键字时 DROP TABLE 不会隐式提交当前事务
+        return f"DROP TEMPORARY TABLE IF EXISTS {table}"
+
+    def json_merge_patch(self, target, patch):
+        return f"JSON_MERGE_PATCH({target}, {patch})"
+
+    def json_array_union(self, target, values):
+        # 逐个元素去重，部分重叠的数组（如 [3] 与 [3, 4]）也不会产生重复元素；需要 MySQL 8.0.14 及以上版本
+        values = mysql_values(values)
+        merged = f"JSON_MERGE_PRESERVE(COALESCE({target}, JSON_ARRAY()), COALESCE({values}, JSON_ARRAY()))"
+        return (f"(SELECT COALESCE(JSON_ARRAYAGG(element), JSON_ARRAY()) FROM (SELECT DISTINCT element "
+                f"FROM JSON_TABLE({merged}, '$[*]' COLUMNS (element JSON PATH '$')) AS elements) AS distinct_values)")
+
+
+class SQLiteCursor:
+    """
+    把 MySQL 风格的 %s 占位符换成 SQLite 的 ?，其余属性直接转发给 sqlite3 游标。
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def execute(self, sql, params=None):
+        self.cursor.execute(sql.replace('%s', '?'), params or ())
+        return self.cursor.rowcount
+
+    def executemany(self, sql, seq_of_params):
+        self.cursor.executemany(sql.replace('%s', '?'), seq_of_params)
+        return self.cursor.rowcount
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+def dict_row_factory(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class SQLiteStorage(Storage):
+    backend = 'sqlite'
+
+    def __init__(self, path, cache_mb=64):
+        if not os.path.isabs(path):
+            path = os.path.join(ROOT_DIR, path)
+        conn = sqlite3.connect(path, timeout=30)
+        # WAL 模式下读写互不阻塞，单机运行时每次提交只需顺序追加日志
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute(f"PRAGMA cache_size = {-cache_mb * 1024}")
+        super().__init__(conn)
+        self.path = path
+
+    def cursor(self, dictionary=True):
+        cursor = self.conn.cursor()
+        if dictionary:
+            cursor.row_factory = dict_row_factory
+        return SQLiteCursor(cursor)
+
+    def upsert(self, table, columns, key_columns, updates=None, select=None):
+        # INSERT ... SELECT 后接 ON CONFLICT 时 SELECT 必须带 WHERE，否则会被解析为联接条件
+        source = f"SELECT * FROM ({select}) WHERE true" if select else \
+            f"VALUES ({', '.join(['%s'] * len(columns))})"
+        if not updates:
+            return f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) {source}"
+        assignments = ', '.join(f"{column} = {expression}" for column, expression in updates.items())
+        return (f"INSERT INTO {table} ({', '.join(columns)}) {source} "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {assignments}")
+
+    def drop_temporary(self, table):
+        return f"DROP TABLE IF EXISTS temp.{table}"
+
+    def json_merge_patch(self, target, patch):
+        return f"json_patch({target}, {patch})"
+
+    def json_array_union(self, target, values):
+        return (f"(SELECT json_group_array(value) FROM (SELECT value FROM json_each({target}) "
+                f"UNION SELECT value FROM json_each({values}) ORDER BY value))")
+
+
+def connect_storage(db_config=None):
+    """
+    按 STORAGE_CONFIG 打开数据库：backend 为 'sqlite' 时使用本地文件，否则连接 MySQL。
+    db_config 可覆盖 config.DB_CONFIG 中的 MySQL 连接参数。
+    """
+    if STORAGE_CONFIG['backend'] == 'sqlite':
+        return SQLiteStorage(STORAGE_CONFIG['sqlite_path'], STORAGE_CONFIG.get('sqlite_cache_mb', 64))
+    return MySQLStorage(db_config or DB_CONFIG)
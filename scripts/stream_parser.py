@@ -0,0 +1,54 @@
+import codecs
+
+from encoding_detect import detect_bytes_encoding
+
+def iter_stream_text(response, chunk_size=1024, sample_size=1024):
+    """
+    逐段解码流式响应。不使用 requests 按响应头猜测的编码（text/* 缺少 charset 时为 ISO-8859-1）：
+    text/event-stream 响应按规范以 UTF-8 解码，只取 data: 行的内容；
+    其余响应先对开头至少 sample_size 个字节检测编码，再用增量解码器解码，多字节字符跨块时不会被截断。
+    """
+    content_type = response.headers.get('Content-Type', '')
+
+    if content_type.startswith('text/event-stream'):
+        for line in response.iter_lines(decode_unicode=False):
+            if line.startswith(b'data:'):
+                # 只去掉 data: 后可选的一个空格，增量内容本身的空白要保留
+                payload = line[5:]
+                if payload.startswith(b' '):
+                    payload = payload[1:]
+                if payload and payload != b'[DONE]':
+                    yield payload.decode('utf-8', errors='replace')
+        return
+
+    decoder = None
+    head = b''
+    for data in response.iter_content(chunk_size=chunk_size):
+        if decoder is None:
+            head += data
+            if len(head) < sample_size:
+                continue
+            encoding, _ = detect_bytes_encoding(head, complete=False)
+            decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+            data, head = head, b''
+        text = decoder.decode(data)
+        if text:
+            yield text
+
+    if decoder is None:
+        # 整个响应不足 sample_size 个字节
+        if not head:
+            return
+        encoding, _ = detect_bytes_encoding(head)
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    text = decoder.decode(head, final=True)
+    if text:
+        yield text
+
+
+def read_stream_text(response):
+    """
+    读取整个流式响应并返回文本。原始字节解码后即丢弃，各段文本最后拼接一次。
+    """
+    with response:
+        return ''.join(iter_stream_text(response))